@@ -1,9 +1,15 @@
 __all__ = (
     "__version__",
+    "bulk_prefix_parameter_dict",
+    "bulk_substitute_in_formulas",
+    "evaluate_many",
     "FormulaSubstitutor",
     "Interpreter",
+    "InterpreterPool",
     "mangle_formula",
     "MissingName",
+    "MonteCarloStore",
+    "ParameterGraph",
     "ParameterSet",
     "PintInterpreter",
     "PintParameterSet",
@@ -14,15 +20,19 @@ __all__ = (
 
 
 from .errors import MissingName
-from .interpreter import Interpreter, PintInterpreter
+from .graph import ParameterGraph
+from .interpreter import Interpreter, InterpreterPool, PintInterpreter
 from .mangling import (
     FormulaSubstitutor,
+    bulk_prefix_parameter_dict,
+    bulk_substitute_in_formulas,
     mangle_formula,
     prefix_parameter_dict,
     substitute_in_formulas,
 )
-from .parameter_set import ParameterSet, PintParameterSet
+from .parameter_set import ParameterSet, PintParameterSet, evaluate_many
 from .pint import PintWrapper
+from .storage import MonteCarloStore
 from .utils import get_version_tuple
 
 __version__ = get_version_tuple()
@@ -0,0 +1,83 @@
+from collections import OrderedDict, namedtuple
+from threading import RLock
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class LRUCache(object):
+    """Thread-safe mapping which keeps at most ``maxsize`` entries, evicting the least
+    recently used one.
+
+    Counts hits and misses of ``get``; use ``info()`` to read them and ``clear()`` to
+    reset them.
+    """
+
+    def __init__(self, maxsize=4096):
+        self._data = OrderedDict()
+        self._lock = RLock()
+        self.hits = self.misses = 0
+        self.maxsize = maxsize
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, value):
+        if value is not None and value < 0:
+            raise ValueError("Cache size must be a positive integer or None")
+        with self._lock:
+            self._maxsize = value
+            self._trim()
+
+    def _trim(self):
+        if self._maxsize is None:
+            return
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._trim()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self._maxsize, len(self._data))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def invalidate(self):
+        """Remove all entries, but keep the hit and miss counts"""
+        with self._lock:
+            self._data.clear()
+
+
+class ParsedFormula(object):
+    """Parsed AST of a formula and (lazily computed) set of symbol names it uses."""
+
+    __slots__ = ("tree", "symbols")
+
+    def __init__(self, tree, symbols=None):
+        self.tree = tree
+        self.symbols = symbols
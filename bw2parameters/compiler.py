@@ -0,0 +1,114 @@
+import ast
+
+from astunparse import unparse
+
+from .errors import UnsupportedFormula
+
+# Expression nodes which compile to the same behaviour as in ``asteval``
+ALLOWED_NODES = (
+    ast.Module,
+    ast.Expr,
+    ast.Expression,
+    ast.Load,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.BoolOp,
+    ast.Compare,
+    ast.IfExp,
+    ast.Call,
+    ast.keyword,
+    ast.Name,
+    ast.Constant,
+    ast.Tuple,
+    ast.List,
+    ast.Subscript,
+    ast.Slice,
+    ast.operator,
+    ast.unaryop,
+    ast.boolop,
+    ast.cmpop,
+) + ((ast.Index,) if hasattr(ast, "Index") else ())
+
+INPUTS = "__inputs"
+FUNCTION = "__evaluate"
+
+
+def get_formula_expression(tree, name=None):
+    """Check that ``tree`` is a single expression using only ``ALLOWED_NODES``, and
+    return the expression node"""
+    if (
+        not isinstance(tree, ast.Module)
+        or len(tree.body) != 1
+        or not isinstance(tree.body[0], ast.Expr)
+    ):
+        raise UnsupportedFormula(
+            "Formula for {} is not a single expression".format(name)
+        )
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise UnsupportedFormula(
+                "Formula for {} uses unsupported syntax: {}".format(
+                    name, node.__class__.__name__
+                )
+            )
+        elif isinstance(node, ast.Name) and node.id.startswith("__"):
+            raise UnsupportedFormula(
+                "Formula for {} uses private name {}".format(name, node.id)
+            )
+    return tree.body[0].value
+
+
+class CompiledParameterSet(object):
+    """Python function which evaluates all formulas of a ``ParameterSet``, in order,
+    with local variables.
+
+    Formulas are taken from the parsed ASTs of the interpreter, and must only use the
+    subset of syntax in ``ALLOWED_NODES``. Other symbols, like ``sqrt``, are looked up
+    once in the interpreter symtable when compiling.
+
+    Call with a dictionary of ``{name: value}`` for all names in ``inputs`` (global
+    parameters and parameters without formula); returns dictionary of all parameter
+    names and values."""
+
+    def __init__(self, parameter_set):
+        interpreter = parameter_set.interpreter
+        names = set(parameter_set.order)
+        if INPUTS in names:
+            raise UnsupportedFormula("Parameter name {} is reserved".format(INPUTS))
+
+        self.inputs, lines, symbols = [], [], set()
+        for key in parameter_set.order:
+            formula = parameter_set.params.get(key, {}).get("formula")
+            if key in parameter_set.global_params or not formula:
+                self.inputs.append(key)
+                lines.append("{0} = {1}[{0!r}]".format(key, INPUTS))
+                continue
+            tree = interpreter.parse_cached(formula).tree
+            expression = get_formula_expression(tree, key)
+            symbols.update(
+                node.id
+                for node in ast.walk(expression)
+                if isinstance(node, ast.Name) and node.id not in names
+            )
+            lines.append("{} = {}".format(key, unparse(expression).strip()))
+
+        namespace = {"__builtins__": {}}
+        for symbol in symbols:
+            try:
+                namespace[symbol] = interpreter.symtable[symbol]
+            except KeyError:
+                raise UnsupportedFormula("Unknown symbol {}".format(symbol))
+
+        lines.append(
+            "return {{{}}}".format(
+                ", ".join("{0!r}: {0}".format(key) for key in parameter_set.order)
+            )
+        )
+        self.source = "def {}({}):\n{}\n".format(
+            FUNCTION, INPUTS, "\n".join("    " + line for line in lines)
+        )
+        exec(compile(self.source, "<bw2parameters>", "exec"), namespace)
+        self.function = namespace[FUNCTION]
+
+    def __call__(self, inputs):
+        return self.function(inputs)
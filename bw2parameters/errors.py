@@ -36,3 +36,9 @@ class BroadcastingError(ValidationError):
     """Formula returns Monte Carlo results with wrong dimensions"""
 
     pass
+
+
+class UnsupportedFormula(ValidationError):
+    """Formula uses syntax which can't be compiled"""
+
+    pass
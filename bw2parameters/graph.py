@@ -0,0 +1,103 @@
+from .parameter_set import ParameterSet, evaluate_many
+
+
+class ParameterGraph(object):
+    """Parameters on three levels, as in Brightway: project, database, and activity
+    groups.
+
+    ``project`` is a dictionary of parameters like those of a ``ParameterSet``;
+    ``databases`` is a dictionary of ``{database name: parameters}``, and ``groups`` a
+    dictionary of ``{(database name, group name): parameters}``. Names are resolved by
+    scope: formulas can use the parameters of their own level and of all levels above
+    it, and a name defined on a lower level hides the same name on a higher level.
+
+    Each level is evaluated with a ``parameter_set_class`` (``ParameterSet`` or
+    ``PintParameterSet``) instance. The project and each database are evaluated at most
+    once, and their results are cached; an activity group only gets the upstream values
+    its formulas use as global parameters, which are not validated again.
+    """
+
+    def __init__(
+        self, project=None, databases=None, groups=None, parameter_set_class=None
+    ):
+        self.project = project or {}
+        self.databases = databases or {}
+        self.groups = groups or {}
+        self.parameter_set_class = parameter_set_class or ParameterSet
+        self.interpreter = self.parameter_set_class.interpreter_class.from_template()
+        self._project_values = None
+        self._database_values = {}
+
+    def get_parameter_set(self, params, upstream):
+        """Build a parameter set for ``params``, with the values in ``upstream`` used by
+        its formulas"""
+        names = set()
+        for value in params.values():
+            names.update(self.interpreter.get_symbols(value.get("formula")))
+        global_params = {
+            name: upstream[name]
+            for name in names
+            if name in upstream and name not in params
+        }
+        return self.parameter_set_class(
+            params, global_params, validate_global_params=False
+        )
+
+    def evaluate_level(self, params, upstream):
+        """Evaluate ``params`` against the ``upstream`` values; returns the values of
+        ``params`` only"""
+        result = self.get_parameter_set(params, upstream).evaluate()
+        return {key: result[key] for key in params}
+
+    def get_project_values(self):
+        if self._project_values is None:
+            self._project_values = self.evaluate_level(self.project, {})
+        return self._project_values
+
+    def get_upstream_values(self, database):
+        """Get the (cached) dictionary of project and ``database`` values visible to the
+        groups of ``database``"""
+        if database not in self._database_values:
+            project = self.get_project_values()
+            values = self.evaluate_level(self.databases.get(database, {}), project)
+            self._database_values[database] = {**project, **values}
+        return self._database_values[database]
+
+    def clear(self):
+        """Forget the cached project and database values, e.g. after changing their
+        parameters"""
+        self._project_values = None
+        self._database_values = {}
+
+    def evaluate(self, executor=None):
+        """Evaluate all levels. Activity groups are evaluated concurrently with
+        ``evaluate_many`` if an ``executor`` is given, which must be thread based.
+
+        Returns dictionary with the values of each level: ``"project"`` values,
+        ``"databases"`` as ``{database: values}`` and ``"groups"`` as
+        ``{(database, group): values}``, where values are ``{name: value}``."""
+        databases = {
+            database: {
+                key: value
+                for key, value in self.get_upstream_values(database).items()
+                if key in self.databases[database]
+            }
+            for database in self.databases
+        }
+        keys = list(self.groups)
+        sets = [
+            self.get_parameter_set(self.groups[key], self.get_upstream_values(key[0]))
+            for key in keys
+        ]
+        if executor is None:
+            results = [parameter_set.evaluate() for parameter_set in sets]
+        else:
+            results = evaluate_many(sets, executor=executor)
+        return {
+            "project": self.get_project_values(),
+            "databases": databases,
+            "groups": {
+                key: {name: result[name] for name in self.groups[key]}
+                for key, result in zip(keys, results)
+            },
+        }
@@ -1,19 +1,85 @@
+import copy
+import time
+from collections import ChainMap
 from collections.abc import Iterable
+from contextlib import contextmanager
 from numbers import Number
+from threading import Lock
 
 import numpy as np
 from asteval import Interpreter as ASTInterpreter
 from asteval import NameFinder
 
+from .cache import LRUCache, ParsedFormula
 from .errors import MissingName
 from .pint import PintWrapper
 
 
+class SymbolScope(ChainMap):
+    """``ChainMap`` of symbol tables, with faster lookups for the few layers used in an
+    ``Interpreter.scope``"""
+
+    def __getitem__(self, key):
+        for mapping in self.maps:
+            if key in mapping:
+                return mapping[key]
+        return self.__missing__(key)
+
+    def get(self, key, default=None):
+        for mapping in self.maps:
+            if key in mapping:
+                return mapping[key]
+        return default
+
+
 class Interpreter(ASTInterpreter):
+    # Parsed formulas are shared by all interpreter instances, keyed by the formula
+    # string
+    formula_cache = LRUCache(maxsize=8192)
+
+    # Default instances of each interpreter class, which are cloned by ``from_template``
+    _templates = {}
+    _templates_lock = Lock()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.BUILTIN_SYMBOLS = set(self.symtable)
 
+    @classmethod
+    def get_template(cls):
+        """Get the template instance of ``cls``, built on first use. Don't modify it."""
+        template = cls._templates.get(cls)
+        if template is None:
+            with cls._templates_lock:
+                template = cls._templates.get(cls)
+                if template is None:
+                    template = cls._templates[cls] = cls()
+        return template
+
+    @classmethod
+    def from_template(cls):
+        """Get a new interpreter with the same symbols as ``cls()``, cloned from a
+        template instance built once per class. This is much cheaper than building the
+        builtin symbol table again."""
+        return cls.get_template().clone()
+
+    def clone(self):
+        """Get an independent copy of this interpreter. The symtable is copied, but not
+        the symbol values."""
+        other = copy.copy(self)
+        other.symtable = dict(self.symtable)
+        other.symtable["print"] = other._printer
+        other.node_handlers = {
+            node: handler.__func__.__get__(other)
+            for node, handler in self.node_handlers.items()
+        }
+        other.readonly_symbols = set(self.readonly_symbols)
+        other.error, other.code_text = [], []
+        other.error_msg = other.expr = other.retval = other._interrupt = None
+        other._calldepth = other.lineno = 0
+        other.start_time = time.time()
+        return other
+
     @classmethod
     def is_numeric(cls, value):
         return isinstance(value, (Number, np.ndarray))
@@ -27,6 +93,26 @@ class Interpreter(ASTInterpreter):
 
         return wrapper
 
+    def parse_cached(self, text):
+        """Returns the ``ParsedFormula`` for ``text``, parsing it only if it is not in
+        ``formula_cache``."""
+        entry = self.formula_cache.get(text)
+        if entry is None or len(text) > self.max_statement_length:
+            entry = ParsedFormula(super().parse(text))
+            self.formula_cache[text] = entry
+        else:
+            self.expr = text
+        return entry
+
+    def parse(self, text):
+        return self.parse_cached(text).tree
+
+    @classmethod
+    def formula_cache_info(cls):
+        """Returns hits, misses, maximum and current size of the shared formula
+        cache."""
+        return cls.formula_cache.info()
+
     @_raise_missing_name
     def get_symbols(self, text):
         """
@@ -34,9 +120,12 @@ class Interpreter(ASTInterpreter):
         """
         if text is None:
             return set()
-        nf = NameFinder()
-        nf.generic_visit(self.parse(text))
-        return set(nf.names)
+        entry = self.parse_cached(text)
+        if entry.symbols is None:
+            nf = NameFinder()
+            nf.generic_visit(entry.tree)
+            entry.symbols = frozenset(nf.names)
+        return set(entry.symbols)
 
     def get_unknown_symbols(
         self,
@@ -63,11 +152,38 @@ class Interpreter(ASTInterpreter):
         all_symbols = set(self.get_symbols(text))
         return all_symbols.difference(known_symbols)
 
+    @property
+    def base_symtable(self):
+        """The symtable below all layers added by ``scope``"""
+        if isinstance(self.symtable, SymbolScope):
+            return self.symtable.maps[-1]
+        return self.symtable
+
+    @contextmanager
+    def scope(self, *layers):
+        """Temporarily layer the mappings ``layers`` over the symtable, first layer on
+        top.
+
+        Names are looked up in the layers first, and assignments go into the first
+        layer, so nothing has to be added to or removed from the symtable. Yields the
+        interpreter."""
+        symtable = self.symtable
+        below = symtable.maps if isinstance(symtable, SymbolScope) else [symtable]
+        self.symtable = SymbolScope(*layers, *below)
+        try:
+            yield self
+        finally:
+            self.symtable = symtable
+
+    def prepare_symbols(self, symbols):
+        """Returns ``symbols`` in the form in which they can be evaluated"""
+        return symbols
+
     def add_symbols(self, symbols):
-        """Adds symbols to the symtable."""
+        """Adds symbols permanently to the symtable, below any ``scope``."""
         if symbols is None:
             return
-        self.symtable.update(symbols)
+        self.base_symtable.update(self.prepare_symbols(symbols))
 
     def remove_symbols(self, symbols):
         """Removes symbols from the symtable."""
@@ -75,18 +191,21 @@ class Interpreter(ASTInterpreter):
             return
         if isinstance(symbols, dict):
             symbols = set(symbols)
+        symtable = self.base_symtable
         for symbol in symbols:
-            self.symtable.pop(symbol)
+            symtable.pop(symbol)
 
     def user_defined_symbols(self):
         return set(self.symtable).difference(self.BUILTIN_SYMBOLS)
 
     @_raise_missing_name
     def eval(self, expr, *args, known_symbols=None, raise_errors=True, **kwargs):
-        self.add_symbols(known_symbols)
-        result = super().eval(expr=expr, *args, raise_errors=raise_errors, **kwargs)
-        self.remove_symbols(known_symbols)
-        return result
+        """Evaluates an expression. ``known_symbols`` are only visible to this
+        evaluation, in their own ``scope``."""
+        if not known_symbols:
+            return super().eval(expr=expr, *args, raise_errors=raise_errors, **kwargs)
+        with self.scope(self.prepare_symbols(dict(known_symbols))):
+            return super().eval(expr=expr, *args, raise_errors=raise_errors, **kwargs)
 
     @classmethod
     def parameter_list_to_dict(cls, param_list):
@@ -111,7 +230,51 @@ class Interpreter(ASTInterpreter):
         obj["amount"] = quantity
 
 
+class InterpreterPool(object):
+    """Reusable interpreters of class ``interpreter_class``, created with
+    ``from_template``.
+
+    ``acquire`` returns an idle interpreter, or a new one; ``release`` resets its
+    symtable to the builtin symbols and keeps it for reuse, up to ``maxsize`` idle
+    interpreters. Use ``interpreter()`` as a context manager to do both.
+    """
+
+    def __init__(self, interpreter_class=None, maxsize=16):
+        self.interpreter_class = interpreter_class or Interpreter
+        self.maxsize = maxsize
+        self._idle = []
+        self._lock = Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self.interpreter_class.from_template()
+
+    def release(self, interpreter):
+        # Copy the template symtable, which also restores overwritten builtin symbols
+        template = interpreter.get_template()
+        interpreter.symtable = dict(template.symtable)
+        interpreter.symtable["print"] = interpreter._printer
+        interpreter.readonly_symbols = set(template.readonly_symbols)
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append(interpreter)
+
+    @contextmanager
+    def interpreter(self):
+        interpreter = self.acquire()
+        try:
+            yield interpreter
+        finally:
+            self.release(interpreter)
+
+
 class PintInterpreter(Interpreter):
+    # Results of ``PintWrapper.string_preprocessor``, which is regex based and therefore
+    # not free
+    preprocessor_cache = LRUCache(maxsize=8192)
+
     def __init__(self, *args, units=None, **kwargs):
         super().__init__(*args, **kwargs)
         if units is not None:
@@ -123,8 +286,15 @@ class PintInterpreter(Interpreter):
             value, PintWrapper.GeneralQuantity
         )
 
-    def parse(self, text):
-        return super().parse(PintWrapper.string_preprocessor(text))
+    def preprocess(self, text):
+        preprocessed = self.preprocessor_cache.get(text)
+        if preprocessed is None:
+            preprocessed = PintWrapper.string_preprocessor(text)
+            self.preprocessor_cache[text] = preprocessed
+        return preprocessed
+
+    def parse_cached(self, text):
+        return super().parse_cached(self.preprocess(text))
 
     def get_unknown_symbols(
         self,
@@ -183,20 +353,18 @@ class PintInterpreter(Interpreter):
     def get_unit_dimensionality(cls, unit_name=None):
         return PintWrapper.get_dimensionality(unit_name)
 
-    def add_symbols(self, symbols):
+    def prepare_symbols(self, symbols):
         """
-        Adds symbols to symtable while making sure that pint Quantities are from same registry as self.ureg
-        (otherwise self.eval will fail).
+        Makes sure that pint Quantities in ``symbols`` are from same registry as
+        self.ureg (otherwise self.eval will fail).
         """
-        if symbols is None:
-            return
         for k, v in symbols.items():
             # if value is a quantity from another unit registry -> convert to current unit registry
             if PintWrapper.is_quantity(
                 v
             ) and not PintWrapper.is_quantity_from_same_registry(v):
                 symbols[k] = PintWrapper.Quantity(value=v.m, units=v.u)
-        super().add_symbols(symbols=symbols)
+        return symbols
 
     def _raise_proper_pint_exception(func):  # noqa
         """Make sure that pint exceptions are correctly raised during evaluation"""
@@ -216,11 +384,17 @@ class PintInterpreter(Interpreter):
         return wrapper
 
     @_raise_proper_pint_exception  # noqa
-    def eval(self, expr, *args, known_symbols=None, **kwargs):
-        pint_symbols = self.get_pint_symbols(
-            text=expr, known_symbols=known_symbols, ignore_symtable=False
-        )
-        self.add_symbols(pint_symbols)
+    def eval(self, expr, *args, known_symbols=None, discover_units=True, **kwargs):
+        """
+        Evaluates an expression. Unknown symbols which are pint units are added to the
+        symtable first, unless ``discover_units`` is ``False`` because the caller
+        already added them.
+        """
+        if discover_units:
+            pint_symbols = self.get_pint_symbols(
+                text=expr, known_symbols=known_symbols, ignore_symtable=False
+            )
+            self.add_symbols(pint_symbols)
         result = super().eval(expr=expr, known_symbols=known_symbols, *args, **kwargs)
         return result
 
@@ -0,0 +1,199 @@
+import ast
+from numbers import Number
+
+import numpy as np
+from astunparse import unparse
+
+from .compiler import get_formula_expression
+from .errors import UnsupportedFormula
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+BINARY_UFUNCS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.Pow: np.power,
+    ast.Mod: np.remainder,
+    ast.FloorDiv: np.floor_divide,
+}
+UNARY_UFUNCS = {ast.USub: np.negative, ast.UAdd: np.positive}
+
+# Functions which ``numexpr`` knows under the same name as numpy
+NUMEXPR_FUNCTIONS = {
+    "sin",
+    "cos",
+    "tan",
+    "arcsin",
+    "arccos",
+    "arctan",
+    "arctan2",
+    "sinh",
+    "cosh",
+    "tanh",
+    "arcsinh",
+    "arccosh",
+    "arctanh",
+    "log",
+    "log10",
+    "log1p",
+    "exp",
+    "expm1",
+    "sqrt",
+    "abs",
+}
+NUMEXPR_NODES = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod)
+
+
+class ArrayKernel(object):
+    """Formula compiled into a fused array computation which writes into a preallocated
+    output array.
+
+    Uses ``numexpr`` if it is installed and supports the formula. Otherwise, the formula
+    is turned into a chain of numpy ufunc calls with ``out=`` arguments, which reuse a
+    few temporary arrays instead of allocating a new one for every operation.
+
+    Raises ``UnsupportedFormula`` if the formula uses anything but arithmetic operators,
+    numeric constants, and numpy ufuncs from the symtable."""
+
+    def __init__(self, tree, symtable, name=None):
+        self.name = name
+        expression = get_formula_expression(tree, name)
+        self.names = sorted(
+            {
+                node.id
+                for node in ast.walk(expression)
+                if isinstance(node, ast.Name)
+                and not isinstance(symtable.get(node.id), np.ufunc)
+            }
+        )
+        self.source = None
+        if numexpr is not None and self._numexpr_compatible(expression, symtable):
+            self.source = unparse(expression).strip()
+            return
+
+        self.instructions = []
+        self.n_temporaries = 0
+        self._free = []
+        self._emit(expression, -1, symtable)
+        self._temporaries = []
+
+    @staticmethod
+    def _numexpr_compatible(expression, symtable):
+        for node in ast.walk(expression):
+            if isinstance(node, ast.Call):
+                if not (
+                    isinstance(node.func, ast.Name)
+                    and node.func.id in NUMEXPR_FUNCTIONS
+                    and symtable.get(node.func.id) is getattr(np, node.func.id, np.abs)
+                    and not node.keywords
+                ):
+                    return False
+            elif isinstance(node, ast.BinOp) and not isinstance(node.op, NUMEXPR_NODES):
+                return False
+            elif not isinstance(
+                node,
+                (ast.Expression, ast.Name, ast.Load, ast.Constant, ast.BinOp)
+                + (ast.UnaryOp, ast.USub, ast.UAdd)
+                + NUMEXPR_NODES,
+            ):
+                return False
+        return True
+
+    def _allocate(self):
+        if self._free:
+            return self._free.pop()
+        self.n_temporaries += 1
+        return self.n_temporaries - 1
+
+    def _operand(self, node, symtable):
+        """Return ``(kind, value)`` for leaf nodes, or ``None``"""
+        if isinstance(node, ast.Name):
+            return ("name", node.id)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, Number):
+            return ("constant", node.value)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            operand = self._operand(node.operand, symtable)
+            if operand is not None and operand[0] == "constant":
+                return ("constant", -operand[1])
+        return None
+
+    def _emit(self, node, destination, symtable):
+        """Add instructions computing ``node`` into buffer ``destination`` (-1 is the
+        output array)"""
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_UFUNCS:
+            ufunc, operands = BINARY_UFUNCS[type(node.op)], [node.left, node.right]
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_UFUNCS:
+            ufunc, operands = UNARY_UFUNCS[type(node.op)], [node.operand]
+        elif (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and isinstance(symtable.get(node.func.id), np.ufunc)
+            and symtable[node.func.id].nin == len(node.args)
+            and symtable[node.func.id].nout == 1
+            and not node.keywords
+        ):
+            ufunc, operands = symtable[node.func.id], node.args
+        elif self._operand(node, symtable) is not None:
+            ufunc, operands = np.positive, [node]
+        else:
+            raise UnsupportedFormula(
+                "Formula for {} can't be fused: {}".format(
+                    self.name, node.__class__.__name__
+                )
+            )
+
+        arguments, temporaries, destination_used = [], [], False
+        for operand in operands:
+            leaf = self._operand(operand, symtable)
+            if leaf is not None:
+                arguments.append(leaf)
+            elif not destination_used:
+                # Compute first non-leaf operand directly into our own destination
+                self._emit(operand, destination, symtable)
+                arguments.append(("buffer", destination))
+                destination_used = True
+            else:
+                temporary = self._allocate()
+                self._emit(operand, temporary, symtable)
+                arguments.append(("buffer", temporary))
+                temporaries.append(temporary)
+        self.instructions.append((ufunc, arguments, destination))
+        self._free.extend(temporaries)
+
+    def __call__(self, symtable, out):
+        """Evaluate with values from ``symtable``, writing into the float array ``out``.
+        Returns ``out``.
+
+        Raises ``TypeError`` if a symbol is neither a number nor a numpy array (e.g. a
+        ``pint.Quantity``).
+        """
+        symbols = {name: symtable[name] for name in self.names}
+        for name, value in symbols.items():
+            if not isinstance(value, (Number, np.ndarray)):
+                raise TypeError("Symbol {} is not numeric: {}".format(name, value))
+        if self.source is not None:
+            return numexpr.evaluate(
+                self.source, local_dict=symbols, out=out, casting="unsafe"
+            )
+
+        if len(self._temporaries) != self.n_temporaries or (
+            self._temporaries and self._temporaries[0].shape != out.shape
+        ):
+            self._temporaries = [np.empty(out.shape) for _ in range(self.n_temporaries)]
+        buffers = self._temporaries + [out]
+        for ufunc, arguments, destination in self.instructions:
+            arguments = [
+                (
+                    buffers[value]
+                    if kind == "buffer"
+                    else symbols[value] if kind == "name" else value
+                )
+                for kind, value in arguments
+            ]
+            ufunc(*arguments, out=buffers[destination], dtype=np.float64)
+        return out
@@ -1,11 +1,25 @@
 import ast
+import io
+import keyword
+import tokenize
 from copy import deepcopy
 
 from asteval.astutils import FROM_MATH, FROM_NUMPY, FROM_PY, NUMPY_RENAMES, NameFinder
 from astunparse import unparse
 
+from .cache import LRUCache
+
 BUILTINS = FROM_MATH + FROM_NUMPY + FROM_PY + tuple(NUMPY_RENAMES.keys())
 
+# ``ast.unparse`` is much faster than ``astunparse``, but only available from Python 3.9
+fast_unparse = getattr(ast, "unparse", unparse)
+
+# f-strings are split into several tokens from Python 3.12
+FSTRING_START = getattr(tokenize, "FSTRING_START", None)
+
+# Names loaded by each formula, shared by all bulk mangling calls
+formula_names_cache = LRUCache(maxsize=65536)
+
 
 class PrefixNameAdder(NameFinder):
     """Change name of all symbols by adding a prefix, unless name already in ``context``."""
@@ -79,25 +93,160 @@ def prefix_parameter_dict(dct, prefix):
 
 
 class FormulaSubstitutor(object):
-    """Callable class that will substitute symbol names using ``substitutions`` substitution dictionary."""
+    """Callable class that will substitute symbol names using ``substitutions``
+    substitution dictionary.
 
-    def __init__(self, substitutions):
+    By default, formulas are parsed and unparsed with ``astunparse``. With
+    ``tokens=True``, only the names are replaced in the tokenized formula, and the rest
+    of the formula text is kept as it is. This is much faster, and results are cached
+    for each formula and set of substitutions. Formulas with ``lambda``,
+    comprehensions or f-strings, whose names can't be resolved from tokens alone,
+    always use the AST."""
+
+    token_cache = LRUCache(maxsize=65536)
+
+    def __init__(self, substitutions, tokens=False):
         self.visitor = OnlySelected(substitutions)
+        self.substitutions = substitutions
+        self.tokens = tokens
+        self.key = frozenset(substitutions.items()) if tokens else None
 
     def __call__(self, formula):
+        if self.tokens:
+            key = (formula, self.key)
+            result = self.token_cache.get(key)
+            if result is None:
+                result = self.substitute_tokens(formula)
+                self.token_cache[key] = result
+            return result
         parsed = ast.parse(formula)
         self.visitor.visit(parsed)
         return unparse(parsed).strip()
 
-
-def substitute_in_formulas(dct, substitutions):
+    def substitute_tokens(self, formula):
+        """Replace the names loaded in ``formula`` by their substitutes, keeping all
+        other text"""
+        try:
+            tokens = list(tokenize.generate_tokens(io.StringIO(formula).readline))
+        except (tokenize.TokenError, SyntaxError):
+            tokens = None
+        if tokens is None or any(map(self._needs_ast, tokens)):
+            parsed = ast.parse(formula)
+            self.visitor.visit(parsed)
+            return unparse(parsed).strip()
+
+        offsets = [0]
+        for line in formula.splitlines(keepends=True):
+            offsets.append(offsets[-1] + len(line))
+
+        pieces, position, previous = [], 0, None
+        for index, token in enumerate(tokens):
+            if (
+                token.type == tokenize.NAME
+                and token.string in self.substitutions
+                and not keyword.iskeyword(token.string)
+                and not (previous is not None and previous.string == ".")
+                and not self._is_keyword_argument(tokens, index)
+            ):
+                start = offsets[token.start[0] - 1] + token.start[1]
+                end = offsets[token.end[0] - 1] + token.end[1]
+                pieces.extend(
+                    (formula[position:start], self.substitutions[token.string])
+                )
+                position = end
+            if token.type not in (tokenize.NL, tokenize.COMMENT):
+                previous = token
+        pieces.append(formula[position:])
+        return "".join(pieces)
+
+    @staticmethod
+    def _needs_ast(token):
+        """Names in ``lambda``, comprehensions and f-strings can't be replaced in
+        tokens. Before Python 3.12, an f-string is a single ``STRING`` token."""
+        if token.type == tokenize.NAME:
+            return token.string in ("lambda", "for")
+        elif token.type == tokenize.STRING:
+            return "f" in token.string[: token.string.index(token.string[-1])].lower()
+        return token.type == FSTRING_START
+
+    @staticmethod
+    def _is_keyword_argument(tokens, index):
+        """Name followed by ``=`` (and not ``==``) is the keyword of an argument, not a
+        loaded name"""
+        for token in tokens[index + 1 :]:
+            if token.type in (tokenize.NL, tokenize.COMMENT):
+                continue
+            return token.type == tokenize.OP and token.string == "="
+        return False
+
+
+def substitute_in_formulas(dct, substitutions, tokens=False):
     """Substitute symbol names in ``dct`` formulas following ``substitutions``.
 
+    If ``tokens``, only the names are replaced and the formula text is otherwise kept
+    (see ``FormulaSubstitutor``).
+
     Modifies in place. Returns the modified ``dct``."""
-    visitor = FormulaSubstitutor(substitutions)
+    visitor = FormulaSubstitutor(substitutions, tokens=tokens)
 
     for obj in dct.values():
         if "formula" in obj:
             obj["formula"] = visitor(obj["formula"])
 
     return dct
+
+
+def get_formula_names(formula):
+    """Get the (cached) ``frozenset`` of all symbol names loaded in ``formula``"""
+    names = formula_names_cache.get(formula)
+    if names is None:
+        names = frozenset(
+            node.id
+            for node in ast.walk(ast.parse(formula))
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+        )
+        formula_names_cache[formula] = names
+    return names
+
+
+def bulk_substitute_in_formulas(dct, substitutions):
+    """Substitute symbol names in ``dct`` formulas following ``substitutions``, like
+    ``substitute_in_formulas``, but faster for large dictionaries.
+
+    Formulas which don't use any of the substituted names are left unchanged, and each
+    distinct formula is only rewritten once. Rewritten formulas are unparsed with
+    ``ast.unparse`` if available, so their text can differ from
+    ``substitute_in_formulas`` (e.g. fewer parentheses), but not their meaning.
+
+    Modifies in place. Returns the modified ``dct``."""
+    visitor = OnlySelected(substitutions)
+    keys = set(substitutions)
+    rewritten = {}
+
+    for obj in dct.values():
+        formula = obj.get("formula")
+        if not formula or keys.isdisjoint(get_formula_names(formula)):
+            continue
+        if formula not in rewritten:
+            parsed = ast.parse(formula)
+            visitor.visit(parsed)
+            rewritten[formula] = fast_unparse(parsed).strip()
+        obj["formula"] = rewritten[formula]
+
+    return dct
+
+
+def bulk_prefix_parameter_dict(dct, prefix):
+    """Add ``prefix`` to each key in ``dct`` and update the formulas, like
+    ``prefix_parameter_dict``, but faster for large dictionaries.
+
+    Parameter dictionaries are shallow copies: nested values are shared with ``dct``,
+    which is not modified. Formulas are updated with ``bulk_substitute_in_formulas``.
+
+    Returns the new dictionary, and a dictionary of name substitutions like
+    ``{old: new}``
+    """
+    substitutions = {key: prefix + key for key in dct}
+    new_dct = {prefix + key: dict(value, original=key) for key, value in dct.items()}
+    bulk_substitute_in_formulas(new_dct, substitutions)
+    return new_dct, substitutions
@@ -1,14 +1,22 @@
 # -*- coding: utf-8 -*-
+import copy
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from numbers import Number
 from pprint import pformat
 
 import numpy as np
-from stats_arrays import uncertainty_choices
+from stats_arrays import NoUncertainty, UndefinedUncertainty, uncertainty_choices
+from stats_arrays.utils import construct_params_array
 
+from .compiler import CompiledParameterSet
 from .errors import *
 from .interpreter import Interpreter, PintInterpreter
+from .kernels import ArrayKernel
 from .pint import PintWrapper
-from .utils import isidentifier
+from .storage import write_monte_carlo
+from .unit_folding import FoldedParameterSet
+from .utils import isidentifier, strongly_connected_components
 
 MC_ERROR_TEXT = """Formula returned array of wrong shape:
 Name: {}
@@ -16,13 +24,123 @@ Formula: {}
 Expected shape: {}
 Returned shape: {}"""
 
+# Parameter array columns taken from parameter dictionaries when sampling, with default
+# values
+SAMPLE_COLUMNS = (
+    ("scale", np.nan),
+    ("shape", np.nan),
+    ("minimum", np.nan),
+    ("maximum", np.nan),
+    ("negative", False),
+)
+
+
+def fix_shape(array, size, materialize=True):
+    """Turn ``array`` into a one-dimensional array of length ``size`` where possible.
+
+    Numbers are repeated ``size`` times, or, unless ``materialize``, turned into a
+    read-only view with zero stride (see ``numpy.broadcast_to``). For a
+    ``pint.Quantity``, the magnitude is reshaped and the units are kept.
+    """
+    if PintWrapper.is_quantity(array):
+        return PintWrapper.Quantity(fix_shape(array.m, size, materialize), array.u)
+    elif array is None:
+        return np.zeros((size,))
+    elif isinstance(array, Number):
+        if not materialize:
+            return np.broadcast_to(np.asarray(array, dtype=np.float64), (size,))
+        return np.ones((size,)) * array
+    elif not isinstance(array, np.ndarray):
+        return np.zeros((size,))
+    elif array.shape in {(1, size), (size, 1)}:
+        return array.reshape((size,))
+    else:
+        return array
+
+
+def is_scalar(value):
+    """Check if ``value``, or the magnitude of a ``pint.Quantity``, is a single
+    number"""
+    if PintWrapper.is_quantity(value):
+        value = value.m
+    return np.ndim(value) == 0
+
+
+def materialize(result):
+    """Copy the zero-stride views in a Monte Carlo ``result`` (see
+    ``evaluate_monte_carlo``) into full arrays.
+
+    Returns a new dictionary; other values are not copied."""
+
+    def copy(value):
+        if PintWrapper.is_quantity(value):
+            return PintWrapper.Quantity(copy(value.m), value.u)
+        elif isinstance(value, np.ndarray) and 0 in value.strides:
+            return np.array(value)
+        return value
+
+    return {key: copy(value) for key, value in result.items()}
+
+
+def concatenate(arrays):
+    """Concatenate one-dimensional arrays, or ``pint.Quantity`` arrays with the same
+    units"""
+    if PintWrapper.is_quantity(arrays[0]):
+        return PintWrapper.Quantity(
+            np.concatenate([array.m for array in arrays]), arrays[0].u
+        )
+    return np.concatenate(arrays)
+
+
+def get_monte_carlo_blocks(iterations, chunk_size, seed=None):
+    """Split ``iterations`` into blocks of at most ``chunk_size``.
+
+    Returns a list of ``(block size, numpy.random.SeedSequence)``, with independent
+    streams spawned from ``seed``.
+    """
+    if chunk_size < 1:
+        raise ValueError("``chunk_size`` must be a positive integer")
+    sizes = [
+        min(chunk_size, iterations - start)
+        for start in range(0, iterations, chunk_size)
+    ]
+    return list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+
+def seeded_random(stream):
+    """Random number generator for ``stats_arrays`` from a
+    ``numpy.random.SeedSequence``"""
+    return np.random.RandomState(np.random.MT19937(stream))
+
+
+def _init_monte_carlo_worker(cls, params, global_params, interpreter_cls, symbols):
+    global _worker_parameter_set
+    interpreter = interpreter_cls.from_template()
+    interpreter.add_symbols(symbols)
+    _worker_parameter_set = cls(
+        params=params, global_params=global_params, interpreter=interpreter
+    )
+
+
+def _monte_carlo_worker(block, **kwargs):
+    size, stream = block
+    return _worker_parameter_set._evaluate_monte_carlo(
+        size, seeded_random=seeded_random(stream), **kwargs
+    )
+
 
 class ParameterSet(object):
-    def __init__(self, params, global_params=None, interpreter=None):
+    interpreter_class = Interpreter
+
+    def __init__(
+        self, params, global_params=None, interpreter=None, validate_global_params=True
+    ):
         self.params = params
         self.global_params = global_params or {}
-        self.interpreter = interpreter or Interpreter()
+        self.interpreter = interpreter or self.interpreter_class.from_template()
         self.basic_validation()
+        if validate_global_params:
+            self.validate_global_params()
         self.all_param_names = set(self.params).union(set(self.global_params))
         self.references = self.get_references()
         for name, references in self.references.items():
@@ -32,61 +150,111 @@ class ParameterSet(object):
                 )
 
         self.order = self.get_order()
+        # Symbol scopes of this set, layered over the interpreter symtable during
+        # evaluation
+        self.global_symbols = self.interpreter.prepare_symbols(dict(self.global_params))
+        self.symbols = {}
+        self._positions = None
+        self._dependents = None
+        self._values = None
+        self._compiled = None
+        self._kernels = {}
+        self._constants = None
 
     def get_order(self):
-        """Get a list of parameter name in an order that they can be safely evaluated"""
-        order = []
-        seen = set(self.interpreter.symtable.keys())
-        refs = self.references.copy()
-
-        while refs:
-            last_iteration = set(refs.keys())
-            for k, v in refs.items():
-                if not v.difference(seen):
-                    seen.add(k)
-                    order.append(k)
-                    refs.pop(k)
-                    break
-            if not last_iteration.difference(set(refs.keys())):
-                seen_lower_case = {x.lower() for x in seen}
-                # Iterate over all remaining references,
-                # and see if references would match if lower cased
-                wrong_case = [
-                    (k, v)
-                    for k, v in refs.items()
-                    if not {x.lower() for x in v}.difference(seen_lower_case)
-                ]
-                if wrong_case:
-                    raise CapitalizationError(
-                        (
-                            "Possible errors in upper/lower case letters for some parameters.\n"
-                            "Unmatched references:\n{}\nMatched references:\n{}"
-                        ).format(
-                            pformat(refs, indent=2),
-                            pformat(sorted(seen), indent=2),
-                        )
-                    )
-                raise ParameterError(
-                    (
-                        "Undefined or circular references for the following:"
-                        "\n{}\nExisting references:\n{}"
-                    ).format(
-                        pformat(refs, indent=2),
-                        pformat(sorted(order), indent=2),
-                    )
-                )
+        """Get a list of parameter name in an order that they can be safely evaluated.
+
+        Uses Kahn's algorithm, so the cost is linear in the number of references."""
+        known = self.interpreter.symtable
+        refs = self.references
+        indegree = dict.fromkeys(refs, 0)
+        dependents = {key: [] for key in refs}
+        for key, references in refs.items():
+            for name in references:
+                if name in refs:
+                    dependents[name].append(key)
+                    indegree[key] += 1
+                elif name not in known:
+                    # Undefined; this parameter can never be evaluated
+                    indegree[key] += 1
+
+        order = [key for key, count in indegree.items() if not count]
+        for key in order:  # ``order`` grows while we iterate over it
+            for dependent in dependents[key]:
+                indegree[dependent] -= 1
+                if not indegree[dependent]:
+                    order.append(dependent)
 
+        if len(order) < len(refs):
+            self.raise_order_error(order)
         return order
 
+    def raise_order_error(self, order):
+        """Raise ``CapitalizationError`` or ``ParameterError`` for parameters missing
+        from ``order``."""
+        known = self.interpreter.symtable
+        ordered = set(order)
+        refs = {
+            key: value for key, value in self.references.items() if key not in ordered
+        }
+
+        seen_lower_case = {x.lower() for x in known}.union(x.lower() for x in order)
+        # See if remaining references would match if lower cased
+        if any(
+            all(x.lower() in seen_lower_case for x in value) for value in refs.values()
+        ):
+            raise CapitalizationError(
+                (
+                    "Possible errors in upper/lower case letters for some parameters.\n"
+                    "Unmatched references:\n{}\nMatched references:\n{}"
+                ).format(
+                    pformat(refs, indent=2),
+                    pformat(sorted(ordered.union(known)), indent=2),
+                )
+            )
+
+        undefined = {
+            name
+            for value in refs.values()
+            for name in value
+            if name not in self.references and name not in known
+        }
+        cycles = [
+            sorted(component)
+            for component in strongly_connected_components(
+                {key: [x for x in value if x in refs] for key, value in refs.items()}
+            )
+            if len(component) > 1
+        ]
+        raise ParameterError(
+            (
+                "Undefined or circular references for the following:"
+                "\n{}\nUndefined names:\n{}\nCircular references:\n{}"
+                "\nExisting references:\n{}"
+            ).format(
+                pformat(refs, indent=2),
+                pformat(sorted(undefined), indent=2),
+                pformat(sorted(cycles), indent=2),
+                pformat(sorted(order), indent=2),
+            )
+        )
+
     def get_references(self):
         """Create dictionary of parameter references"""
         refs = {
-            key: self.interpreter.get_unknown_symbols(value.get("formula"))
+            key: self.get_formula_references(value.get("formula"))
             for key, value in self.params.items()
         }
         refs.update({key: set() for key in self.global_params})
         return refs
 
+    def get_formula_references(self, formula):
+        """Get the set of names used in ``formula`` which are parameters of this set or
+        unknown to the interpreter"""
+        return self.interpreter.get_unknown_symbols(formula).union(
+            self.all_param_names.intersection(self.interpreter.get_symbols(formula))
+        )
+
     def basic_validation(self):
         """Basic validation needed to build ``references`` and ``order``"""
         if not isinstance(self.params, dict):
@@ -114,6 +282,11 @@ class ParameterSet(object):
                 raise DuplicateName(
                     "Parameter name {} is a built-in symbol".format(key)
                 )
+
+    def validate_global_params(self):
+        """Check that global parameters have valid names and numeric values. Can be
+        skipped when creating the set, e.g. if the global parameters are the results of
+        another set."""
         for key, value in self.global_params.items():
             if not self.interpreter.is_numeric(value):
                 raise ValueError(
@@ -126,24 +299,271 @@ class ParameterSet(object):
                     "Global parameter label {} not a valid " "Python name".format(key)
                 )
 
-    def evaluate(self):
-        """Evaluate each formula. Returns dictionary of parameter names and values."""
-        interpreter = self.interpreter
+    def scope(self, symbols=None):
+        """Context manager layering the symbols of this set over the interpreter
+        symtable: ``global_symbols``, then the values of the last evaluation in
+        ``symbols`` (or the given ``symbols`` instead). Yields the interpreter.
+
+        Values of the set are only visible inside this scope, so they don't leak into a
+        shared interpreter.
+        """
+        return self.interpreter.scope(
+            self.symbols if symbols is None else symbols, self.global_symbols
+        )
+
+    def evaluate(self, compiled=False):
+        """Evaluate each formula. Returns dictionary of parameter names and values.
+
+        If ``compiled``, use the function from ``compile`` instead of interpreting each
+        formula.
+        """
+        if compiled:
+            compiled = self.compile()
+            result = compiled(
+                {
+                    key: (
+                        self.global_symbols[key]
+                        if key in self.global_symbols
+                        else self.evaluate_parameter(key)
+                    )
+                    for key in compiled.inputs
+                }
+            )
+            self.symbols.update(result)
+            self._values = result
+            return result
+
         result = {}
-        for key in self.order:
+        with self.scope() as interpreter:
+            symtable = interpreter.symtable
+            for key in self.order:
+                result[key] = self.evaluate_parameter(key)
+                if key not in self.global_symbols:
+                    symtable[key] = result[key]
+        self._values = result
+        return result
+
+    def compile(self):
+        """Compile all formulas into a single Python function; see
+        ``bw2parameters.compiler.CompiledParameterSet``.
+
+        The function is cached, and rebuilt after ``update``. Raises
+        ``UnsupportedFormula`` if any formula uses syntax outside of the supported
+        subset. The compiled function runs as plain Python, so the limits of
+        ``asteval`` (like the maximum exponent or string length) don't apply; only
+        compile formulas from trusted sources."""
+        if self._compiled is None:
+            self._compiled = CompiledParameterSet(self)
+        return self._compiled
+
+    def clone(self):
+        """Get a copy of this set with its own interpreter (see ``Interpreter.clone``)
+        and evaluation state.
+
+        ``params``, ``global_params``, references and the compiled function are shared
+        with this set, so the clone can be evaluated concurrently with it, but should
+        not be ``update``d."""
+        other = copy.copy(self)
+        other.interpreter = self.interpreter.clone()
+        other.global_symbols = dict(self.global_symbols)
+        other.symbols = {}
+        other._values = None
+        other._kernels = {}
+        other._constants = None
+        return other
+
+    def interpret(self, formula):
+        """Evaluate ``formula`` with the interpreter"""
+        return self.interpreter(formula)
+
+    def evaluate_parameter(self, key):
+        """Evaluate a single parameter, assuming the parameters it references are
+        already in the symtable."""
+        if key in self.global_params:
+            return self.global_params[key]
+        elif self.params[key].get("formula"):
+            return self.interpret(self.params[key]["formula"])
+        elif "amount" in self.params[key]:
+            return self.params[key]["amount"]
+        else:
+            raise ValueError(
+                "No suitable formula or static amount found " "in {}".format(key)
+            )
+
+    def update(self, changes):
+        """Change some parameters and re-evaluate only the parameters which depend on
+        them.
+
+        ``changes`` is a dictionary of ``{name: new amount or formula}``; strings are
+        treated as formulas, anything else as a static amount. Global parameters can
+        only be given new values.
+
+        ``references`` and ``order`` are patched locally, and the values of parameters
+        outside the downstream closure of the changed parameters are reused from the
+        last evaluation. If the set was never evaluated, it is evaluated in full.
+
+        Returns the set of parameter names which were re-evaluated."""
+        new_references = {}
+        for key, value in changes.items():
             if key in self.global_params:
-                value = self.global_params[key]
-            elif self.params[key].get("formula"):
-                value = interpreter(self.params[key]["formula"])
-            elif "amount" in self.params[key]:
-                value = self.params[key]["amount"]
+                if not self.interpreter.is_numeric(value):
+                    raise ValueError(
+                        "Global parameter {} does not have a numeric value: {}".format(
+                            key, value
+                        )
+                    )
+            elif key not in self.params:
+                raise ValueError(
+                    "Parameter {} is not in this parameter set".format(key)
+                )
+            elif isinstance(value, str):
+                references = self.get_formula_references(value)
+                if key in references:
+                    raise SelfReference(
+                        "Formula for parameter {} references itself".format(key)
+                    )
+                undefined = {
+                    name
+                    for name in references
+                    if name not in self.references
+                    and name not in self.interpreter.symtable
+                }
+                if undefined:
+                    raise ParameterError(
+                        "Undefined references in formula for {}: {}".format(
+                            key, sorted(undefined)
+                        )
+                    )
+                new_references[key] = references
+            elif self.interpreter.is_numeric(value):
+                new_references[key] = set()
             else:
                 raise ValueError(
-                    "No suitable formula or static amount found " "in {}".format(key)
+                    "Parameter {} must be given a formula or a numeric amount".format(
+                        key
+                    )
                 )
-            result[key] = value
-            self.interpreter.add_symbols({key: value})
-        return result
+
+        self._set_references(new_references)
+        self._compiled = None
+        self._kernels = {}
+        self._constants = None
+
+        for key, value in changes.items():
+            if key in self.global_params:
+                self.global_params[key] = value
+                self.global_symbols.update(
+                    self.interpreter.prepare_symbols({key: value})
+                )
+            elif isinstance(value, str):
+                self.params[key]["formula"] = value
+            else:
+                self.params[key]["amount"] = value
+                self.params[key].pop("formula", None)
+
+        if self._values is None:
+            return set(self.evaluate())
+
+        dependents = self.get_dependents()
+        changed, stack = set(changes), list(changes)
+        while stack:
+            for dependent in dependents[stack.pop()]:
+                if dependent not in changed:
+                    changed.add(dependent)
+                    stack.append(dependent)
+
+        # New dictionary, so results returned by earlier evaluations don't change
+        positions, values = self._positions, dict(self._values)
+        with self.scope() as interpreter:
+            for key in sorted(changed, key=positions.__getitem__):
+                values[key] = self.evaluate_parameter(key)
+                if key not in self.global_symbols:
+                    interpreter.symtable[key] = values[key]
+        self._values = values
+        return changed
+
+    def get_dependents(self):
+        """Get dictionary of ``{name: names of parameters referencing it}``"""
+        if self._dependents is None:
+            self._dependents = {key: set() for key in self.references}
+            for key, references in self.references.items():
+                for name in references:
+                    if name in self._dependents:
+                        self._dependents[name].add(key)
+        return self._dependents
+
+    def _set_references(self, new_references):
+        """Replace the references of some parameters, and move parameters in ``order``
+        where needed.
+
+        Uses the Pearce-Kelly dynamic topological sort: an edge which violates the
+        current order only reorders the parameters between the two ends of the edge
+        which are connected to them. All changes are rolled back if the new references
+        create a cycle."""
+        dependents = self.get_dependents()
+        if self._positions is None:
+            self._positions = {key: index for index, key in enumerate(self.order)}
+        positions = self._positions
+        old_references = {key: self.references[key] for key in new_references}
+        journal = []  # (index, key previously at that index)
+
+        def set_references(references):
+            for key, value in references.items():
+                for name in self.references[key]:
+                    if name in dependents:
+                        dependents[name].discard(key)
+                for name in value:
+                    if name in dependents:
+                        dependents[name].add(key)
+                self.references[key] = value
+
+        set_references(new_references)
+        try:
+            for key, references in new_references.items():
+                for name in references:
+                    if name in positions and positions[name] > positions[key]:
+                        self._reorder(name, key, journal)
+        except ParameterError:
+            for index, key in reversed(journal):
+                self.order[index] = key
+                positions[key] = index
+            set_references(old_references)
+            raise
+
+    def _reorder(self, before, after, journal):
+        """Move parameters so that ``before`` comes before ``after`` in ``order``"""
+        positions, dependents = self._positions, self._dependents
+        lower, upper = positions[after], positions[before]
+
+        forward, stack = {after}, [after]
+        while stack:
+            for dependent in dependents[stack.pop()]:
+                if dependent == before:
+                    raise ParameterError(
+                        "Circular reference between {} and {}".format(before, after)
+                    )
+                if dependent not in forward and positions[dependent] < upper:
+                    forward.add(dependent)
+                    stack.append(dependent)
+
+        backward, stack = {before}, [before]
+        while stack:
+            for name in self.references[stack.pop()]:
+                if (
+                    name in positions
+                    and name not in backward
+                    and positions[name] > lower
+                ):
+                    backward.add(name)
+                    stack.append(name)
+
+        moved = sorted(backward, key=positions.__getitem__) + sorted(
+            forward, key=positions.__getitem__
+        )
+        for index, key in zip(sorted(positions[key] for key in moved), moved):
+            journal.append((index, self.order[index]))
+            self.order[index] = key
+            positions[key] = index
 
     def evaluate_and_set_amount_field(self):
         """Evaluate each formula. Updates the ``amount`` field of each parameter."""
@@ -152,63 +572,521 @@ class ParameterSet(object):
             value["amount"] = result[key]
         return result
 
-    def evaluate_monte_carlo(self, iterations=1000):
+    def evaluate_monte_carlo(
+        self,
+        iterations=1000,
+        seed=None,
+        processes=None,
+        chunk_size=1000,
+        fused=False,
+        fold_constants=False,
+        materialize=True,
+        targets=None,
+    ):
         """Evaluate each formula using Monte Carlo and variable uncertainty data, if present.
 
         Formulas **must** return a one-dimensional array, or ``BroadcastingError`` is raised.
 
-        Returns dictionary of ``{parameter name: numpy array}``."""
-        interpreter = self.interpreter
+        If ``seed`` or ``processes`` is given, the iterations are split into blocks of
+        ``chunk_size``, and each block is sampled with its own random stream spawned
+        from ``numpy.random.SeedSequence(seed)``. With ``processes`` larger than one,
+        blocks are evaluated in a pool of worker processes, each with a new parameter
+        set and interpreter of the same classes. Blocks are concatenated in order, so
+        for a given ``seed`` and ``chunk_size`` the result doesn't depend on the number
+        of processes.
+
+        If ``fused``, formulas are evaluated with ``bw2parameters.kernels.ArrayKernel``
+        where possible, which writes into preallocated arrays instead of creating a
+        temporary array for every operation.
+
+        If ``fold_constants``, the parameters in ``get_constants`` are evaluated only
+        once, as scalars, and only the other formulas are evaluated on arrays. Results
+        are the same, unless a formula reduces an array of constant values, like
+        ``sum(A)``.
+
+        Unless ``materialize``, inputs without uncertainty and formulas returning a
+        single number are not repeated for each iteration, but kept as read-only views
+        with zero stride. They have the same shape and values, but use almost no memory;
+        ``bw2parameters.parameter_set.materialize`` turns them into full arrays. Results
+        are only kept as views if the iterations are evaluated in a single block.
+
+        If ``targets`` is a list of parameter names, only these and the parameters they
+        depend on are sampled and evaluated, and each other array is dropped as soon as
+        the last formula using it is evaluated (see ``get_liveness``). Peak memory then
+        depends on the inputs and the width of the graph below the targets, instead of
+        the number of parameters. As fewer inputs are sampled, results only match those
+        of a run without ``targets`` and the same ``seed`` if all uncertain inputs are
+        needed.
+
+        Returns dictionary of ``{parameter name: numpy array}``, for ``targets`` only if
+        given.
+        """
+        options = {
+            "fused": fused,
+            "fold_constants": fold_constants,
+            "materialize": materialize,
+            "targets": targets,
+        }
+        blocks = get_monte_carlo_blocks(iterations, chunk_size, seed)
+        if (seed is None and processes is None) or not blocks:
+            return self._evaluate_monte_carlo(iterations, **options)
+        if processes is not None and processes > 1:
+            with ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=_init_monte_carlo_worker,
+                initargs=(
+                    type(self),
+                    self.params,
+                    self.global_params,
+                    type(self.interpreter),
+                    {
+                        key: self.interpreter.symtable[key]
+                        for key in self.interpreter.user_defined_symbols()
+                    },
+                ),
+            ) as executor:
+                results = list(
+                    executor.map(partial(_monte_carlo_worker, **options), blocks)
+                )
+        else:
+            results = [
+                self._evaluate_monte_carlo(
+                    size, seeded_random=seeded_random(stream), **options
+                )
+                for size, stream in blocks
+            ]
+        if len(results) == 1:
+            return results[0]
+        return {
+            key: concatenate([result[key] for result in results]) for key in results[0]
+        }
+
+    def iter_monte_carlo(
+        self,
+        iterations=1000,
+        chunk_size=1000,
+        seed=None,
+        out=None,
+        fused=False,
+        fold_constants=False,
+    ):
+        """Evaluate each formula using Monte Carlo like ``evaluate_monte_carlo``, in
+        blocks of at most ``chunk_size`` iterations, so that memory use doesn't grow
+        with ``iterations``.
+
+        Yields dictionaries of ``{parameter name: numpy array}``. The arrays are views
+        into float buffers which are allocated once and overwritten by the next block,
+        so copy whatever should be kept. Alternatively, ``out`` can be an array of shape
+        ``(len(self.order), iterations)``, e.g. a memory map, and each block is written
+        into its own columns of ``out``.
+
+        With a ``seed``, the blocks are the same as those of ``evaluate_monte_carlo``
+        with the same ``seed`` and ``chunk_size``. ``fused`` and ``fold_constants`` are
+        used as in ``evaluate_monte_carlo``.
+        """
+        start = None
+        if out is None:
+            buffers = np.empty((len(self.order), min(chunk_size, iterations)))
+        elif out.shape != (len(self.order), iterations):
+            raise ValueError(
+                "``out`` must have shape {}".format((len(self.order), iterations))
+            )
+        else:
+            buffers, start = out, 0
+        for size, stream in get_monte_carlo_blocks(iterations, chunk_size, seed):
+            if start is None:
+                block = buffers[:, :size]
+            else:
+                block, start = buffers[:, start : start + size], start + size
+            yield self._evaluate_monte_carlo(
+                size,
+                out=dict(zip(self.order, block)),
+                seeded_random=None if seed is None else seeded_random(stream),
+                fused=fused,
+                fold_constants=fold_constants,
+            )
+
+    def save_monte_carlo(self, dirpath, iterations=1000, chunk_size=1000, seed=None):
+        """Evaluate using Monte Carlo and write results to memory-mapped files in
+        ``dirpath``.
+
+        See ``bw2parameters.storage.write_monte_carlo``; returns a ``MonteCarloStore``
+        for reading the results.
+        """
+        return write_monte_carlo(
+            self, dirpath, iterations=iterations, chunk_size=chunk_size, seed=seed
+        )
+
+    def _evaluate_monte_carlo(
+        self,
+        iterations,
+        out=None,
+        seeded_random=None,
+        fused=False,
+        fold_constants=False,
+        materialize=True,
+        targets=None,
+    ):
+        """Monte Carlo evaluation, optionally writing into ``out``, a dictionary of
+        ``{name: array}``"""
         result = {}
+        constants = self.get_constants() if fold_constants else {}
+        lazy = {} if materialize or constants else self.get_constant_inputs()
+        exclude = set(constants or lazy)
+        if targets is None:
+            keys, frees = self.order, {}
+        else:
+            keys, frees = self.get_liveness(targets)
+            targets = set(targets)
+            # Only sample the inputs the targets depend on
+            exclude.update(set(self.order).difference(keys))
+        samples = self.sample_inputs(
+            iterations, seeded_random=seeded_random, exclude=exclude
+        )
+        with self.interpreter.scope({}, constants, self.global_symbols) as interpreter:
+            for key in keys:
+                if key in lazy:
+                    value = fix_shape(lazy[key], iterations, materialize=False)
+                elif key in constants:
+                    value = fix_shape(constants[key], iterations, materialize)
+                    if value.shape != (iterations,):
+                        raise BroadcastingError(
+                            MC_ERROR_TEXT.format(
+                                key,
+                                self.params.get(key, {}).get("formula"),
+                                (iterations,),
+                                value.shape,
+                            )
+                        )
+                elif key in samples:
+                    value = samples.pop(key)
+                elif fused and self.get_kernel(key) is not None:
+                    value = self.evaluate_formula_kernel(
+                        key, iterations, None if out is None else out[key]
+                    )
+                else:
+                    value = self.evaluate_formula_array(key, iterations, materialize)
+                if out is not None and value is not out[key]:
+                    if PintWrapper.is_quantity(value):
+                        # Buffers hold magnitudes; units are kept in a single wrapping
+                        # Quantity
+                        out[key][:] = value.m
+                        value = PintWrapper.Quantity(out[key], value.u)
+                    else:
+                        out[key][:] = value
+                        value = out[key]
+                if targets is None or key in targets:
+                    result[key] = value
+                if key not in constants or not is_scalar(constants[key]):
+                    interpreter.symtable[key] = value
+                for name in frees.get(key, ()):
+                    interpreter.symtable.maps[0].pop(name, None)
+        return result
+
+    def get_liveness(self, targets):
+        """Plan the evaluation of parameters ``targets``: returns the list of parameters
+        to evaluate, in order (the targets and the parameters they depend on), and a
+        dictionary of ``{parameter: names no longer needed after evaluating it}``."""
+        unknown = set(targets).difference(self.references)
+        if unknown:
+            raise ValueError("Unknown target parameters: {}".format(sorted(unknown)))
+        needed, stack = set(targets), list(targets)
+        while stack:
+            for name in self.references[stack.pop()]:
+                if name in self.references and name not in needed:
+                    needed.add(name)
+                    stack.append(name)
+        keys = [key for key in self.order if key in needed]
+
+        last_consumers = {}
+        for key in keys:
+            for name in self.references[key]:
+                if name in needed:
+                    last_consumers[name] = key
+        frees = {}
+        for name in keys:
+            if name in last_consumers and name not in targets:
+                frees.setdefault(last_consumers[name], []).append(name)
+        return keys, frees
 
-        def get_rng_sample(obj):
-            if isinstance(obj, np.ndarray):
+    @staticmethod
+    def get_loc(obj):
+        """Get the ``loc`` used to sample parameter ``obj`` without formula"""
+        if "uncertainty_type" not in obj:
+            return obj.get("loc") or obj["amount"]
+        return obj.get("loc", np.nan)
+
+    def get_constant_inputs(self):
+        """Get the values of global parameters which are not arrays, and of parameters
+        without formula and without uncertainty (``uncertainty_type`` missing, 0 or 1),
+        as used in Monte Carlo sampling
+        """
+        constants = {
+            key: self.global_symbols[key]
+            for key, value in self.global_params.items()
+            if is_scalar(value)
+        }
+        for key, obj in self.params.items():
+            if obj.get("formula"):
+                continue
+            uncertainty_type = obj.get("uncertainty_type", obj.get("uncertainty type"))
+            if uncertainty_type in (None, UndefinedUncertainty.id, NoUncertainty.id):
+                constants[key] = self.get_loc(obj)
+        return constants
+
+    def get_constants(self):
+        """Get the (cached) values of all parameters which are the same in every Monte
+        Carlo iteration: the ``get_constant_inputs``, and the formulas which only
+        reference constants, evaluated once as scalars.
+        """
+        if self._constants is None:
+            constants = self.get_constant_inputs()
+            with self.interpreter.scope(constants, self.global_symbols):
+                for key in self.order:
+                    if (
+                        key not in constants
+                        and key in self.params
+                        and self.params[key].get("formula")
+                        and self.references[key].issubset(constants)
+                    ):
+                        constants[key] = self.evaluate_parameter(key)
+            self._constants = constants
+        return self._constants
+
+    def sample_inputs(self, iterations, seeded_random=None, exclude=()):
+        """Draw Monte Carlo samples for global parameters and for parameters without a
+        formula, except those in ``exclude``.
+
+        Parameters are grouped by ``uncertainty_type``, and each group is sampled with a
+        single call to ``bounded_random_variables``, using ``seeded_random`` (a
+        ``numpy.random.RandomState``) if given. Parameters without uncertainty type are
+        treated as ``uncertainty_type`` 0 with their ``amount`` as ``loc``. Global
+        parameters which are already arrays are used as given.
+
+        Returns dictionary of ``{parameter name: numpy array}``."""
+        samples, groups = {}, {}
+        for key, value in self.global_params.items():
+            if key in exclude:
+                continue
+            elif isinstance(value, np.ndarray):
                 # Already a Monte Carlo sample
-                return obj
-            if "uncertainty_type" not in obj:
-                if "uncertainty type" not in obj:
-                    obj = obj.copy()
-                    obj["uncertainty_type"] = 0
-                else:
-                    obj["uncertainty_type"] = obj["uncertainty type"]
-                obj["loc"] = obj.get("loc") or obj["amount"]
-            kls = uncertainty_choices[obj["uncertainty_type"]]
-            return kls.bounded_random_variables(kls.from_dicts(obj), iterations).ravel()
-
-        def fix_shape(array):
-            if array is None:
-                return np.zeros((iterations,))
-            elif isinstance(array, Number):
-                return np.ones((iterations,)) * array
-            elif not isinstance(array, np.ndarray):
-                return np.zeros((iterations,))
-            elif array.shape in {(1, iterations), (iterations, 1)}:
-                return array.reshape((iterations,))
+                samples[key] = value
             else:
-                return array
+                samples[key] = fix_shape(value, iterations)
+        for key, obj in self.params.items():
+            if obj.get("formula") or key in exclude:
+                continue
+            uncertainty_type = obj.get("uncertainty_type", obj.get("uncertainty type"))
+            groups.setdefault(uncertainty_type or 0, []).append(
+                (key, obj, self.get_loc(obj))
+            )
 
-        for key in self.order:
-            if key in self.global_params:
-                interpreter.symtable[key] = result[key] = get_rng_sample(
-                    self.global_params[key]
+        for uncertainty_type, group in groups.items():
+            params = construct_params_array(len(group), True)
+            for column, default in SAMPLE_COLUMNS:
+                params[column] = [obj.get(column, default) for _, obj, _ in group]
+            params["loc"] = [loc for _, _, loc in group]
+            params["uncertainty_type"] = uncertainty_type
+            kls = uncertainty_choices[uncertainty_type]
+            array = kls.bounded_random_variables(
+                params, iterations, seeded_random=seeded_random
+            )
+            # Copy the rows: strided views are slow to compute with, and would keep
+            # the whole block alive
+            for index, (key, _, _) in enumerate(group):
+                samples[key] = array[index].copy()
+        return samples
+
+    def evaluate_formula_array(self, key, size, materialize=True):
+        """Evaluate the formula of parameter ``key`` for input arrays of length
+        ``size``.
+
+        Raises ``BroadcastingError`` if the result can't be given the shape ``(size,)``.
+        ``materialize`` is passed on to ``fix_shape``."""
+        formula = self.params[key]["formula"]
+        sample = fix_shape(self.interpret(formula), size, materialize)
+        if sample.shape != (size,):
+            raise BroadcastingError(
+                MC_ERROR_TEXT.format(key, formula, (size,), sample.shape)
+            )
+        return sample
+
+    def get_kernel(self, key):
+        """Get the cached ``ArrayKernel`` for the formula of parameter ``key``, or
+        ``None`` if it can't be fused"""
+        if key not in self._kernels:
+            try:
+                self._kernels[key] = ArrayKernel(
+                    self.interpreter.parse_cached(self.params[key]["formula"]).tree,
+                    self.interpreter.symtable,
+                    key,
                 )
-            elif self.params[key].get("formula"):
-                sample = fix_shape(interpreter(self.params[key]["formula"]))
-                if sample.shape != (iterations,):
-                    raise BroadcastingError(
-                        MC_ERROR_TEXT.format(
-                            key,
-                            self.params[key]["formula"],
-                            (iterations,),
-                            sample.shape,
+            except UnsupportedFormula:
+                self._kernels[key] = None
+        return self._kernels[key]
+
+    def evaluate_formula_kernel(self, key, size, out=None):
+        """Evaluate the formula of parameter ``key`` with its ``ArrayKernel`` into
+        ``out``, or a new array.
+
+        Falls back to ``evaluate_formula_array`` if the kernel can't be applied to the
+        current symbols, e.g. because of their type or shape."""
+        if out is None:
+            out = np.empty((size,))
+        try:
+            return self.get_kernel(key)(self.interpreter.symtable, out)
+        except (TypeError, ValueError, KeyError):
+            return self.evaluate_formula_array(key, size)
+
+    def evaluate_scenarios(self, scenarios, names=None, as_array=False):
+        """Evaluate each formula once for many scenarios, using numpy arrays over the
+        scenario axis.
+
+        ``scenarios`` gives the overriding values of some global parameters or
+        parameters in each scenario: either a dictionary of
+        ``{name: one-dimensional array}``, or a two-dimensional array with one row per
+        name in ``names``. An overridden parameter takes the given values instead of its
+        formula or amount; all other parameters are evaluated as in ``evaluate``. Like
+        in ``evaluate_monte_carlo``, formulas **must** return a one-dimensional array,
+        or ``BroadcastingError`` is raised.
+
+        Returns dictionary of ``{parameter name: numpy array}``, or, if ``as_array``, a
+        two-dimensional array with one row per parameter (in the order of
+        ``self.order``) and one column per scenario.
+        """
+        if isinstance(scenarios, np.ndarray):
+            if names is None or scenarios.ndim != 2 or len(names) != scenarios.shape[0]:
+                raise ValueError(
+                    "Scenario array must be two-dimensional, with one row per "
+                    "name in ``names``"
+                )
+            scenarios = dict(zip(names, scenarios))
+        scenarios = {key: np.asarray(value) for key, value in scenarios.items()}
+
+        unknown = set(scenarios).difference(self.references)
+        if unknown:
+            raise ValueError(
+                "Scenario values given for unknown parameters: {}".format(
+                    sorted(unknown)
+                )
+            )
+        sizes = {value.shape for value in scenarios.values()}
+        if len(sizes) != 1 or len(next(iter(sizes))) != 1:
+            raise ValueError(
+                "Scenario values must be one-dimensional arrays of equal length"
+            )
+        (size,) = sizes.pop()
+
+        result = {}
+        with self.scope({}) as interpreter:
+            for key in self.order:
+                if key in scenarios:
+                    value = scenarios[key]
+                elif key not in self.global_params and self.params[key].get("formula"):
+                    value = self.evaluate_formula_array(key, size)
+                else:
+                    value = fix_shape(self.evaluate_parameter(key), size)
+                    if value.shape != (size,):
+                        raise BroadcastingError(
+                            MC_ERROR_TEXT.format(key, None, (size,), value.shape)
                         )
+                interpreter.symtable[key] = result[key] = value
+
+        if as_array:
+            return np.vstack([result[key] for key in self.order])
+        return result
+
+    def evaluate_formulas(self, formulas, values):
+        """Evaluate each distinct formula in ``formulas`` once with the interpreter,
+        with the parameter ``values`` layered over the symtable. Returns dictionary of
+        ``{formula: value}``.
+
+        Parsed formulas are taken from the shared formula cache, and the limits of
+        ``asteval`` (like the maximum exponent or string length) apply as usual."""
+        results = dict.fromkeys(formulas)
+        with self.scope(values) as interpreter:
+            for formula in results:
+                results[formula] = interpreter(formula)
+        return results
+
+    @staticmethod
+    def get_exchange_formula(obj):
+        return obj if isinstance(obj, str) else obj.get("formula")
+
+    def evaluate_exchanges(self, exchanges, values=None, as_array=False):
+        """Evaluate the formulas of many ``exchanges`` (dictionaries with a ``formula``
+        field, or formula strings) against the parameter ``values``, by default those of
+        the last evaluation. Each distinct formula is only evaluated once, with
+        ``evaluate_formulas``. Exchanges without formula keep their ``amount`` (or
+        ``None``).
+
+        Returns a list of amounts in the order of ``exchanges``, or, if ``as_array``, a
+        float array (with the magnitudes of ``pint.Quantity`` amounts and NaN for
+        missing amounts)."""
+        if values is None:
+            values = self._values if self._values is not None else self.evaluate()
+        formulas = self.evaluate_formulas(
+            filter(None, map(self.get_exchange_formula, exchanges)), values
+        )
+
+        amounts = []
+        for obj in exchanges:
+            formula = self.get_exchange_formula(obj)
+            amounts.append(formulas[formula] if formula else obj.get("amount"))
+        if as_array:
+            return np.array(
+                [
+                    (
+                        np.nan
+                        if amount is None
+                        else amount.m if PintWrapper.is_quantity(amount) else amount
+                    )
+                    for amount in amounts
+                ],
+                dtype=np.float64,
+            )
+        return amounts
+
+    def evaluate_exchanges_monte_carlo(
+        self, exchanges, iterations=1000, samples=None, **kwargs
+    ):
+        """Evaluate the formulas of ``exchanges`` (like in ``evaluate_exchanges``) for
+        each Monte Carlo iteration.
+
+        ``samples`` are the results of ``evaluate_monte_carlo``; if not given, they are
+        computed with ``iterations`` and ``kwargs``. Each distinct formula is evaluated
+        once, on the whole arrays. Exchanges without formula repeat their ``amount`` (or
+        NaN) in each iteration.
+
+        Returns a C-contiguous float array of shape ``(len(exchanges), iterations)``,
+        with the magnitudes of ``pint.Quantity`` amounts. Raises ``BroadcastingError``
+        if a formula result can't be given one value per iteration."""
+        if samples is None:
+            samples = self.evaluate_monte_carlo(iterations, **kwargs)
+        elif samples:
+            iterations = len(next(iter(samples.values())))
+        formulas = self.evaluate_formulas(
+            filter(None, map(self.get_exchange_formula, exchanges)), samples
+        )
+
+        out = np.empty((len(exchanges), iterations))
+        for row, obj in enumerate(exchanges):
+            formula = self.get_exchange_formula(obj)
+            value = formulas[formula] if formula else obj.get("amount", np.nan)
+            value = fix_shape(np.nan if value is None else value, iterations)
+            if PintWrapper.is_quantity(value):
+                value = value.m
+            if np.shape(value) != (iterations,):
+                raise BroadcastingError(
+                    MC_ERROR_TEXT.format(
+                        "exchange {}".format(row),
+                        formula,
+                        (iterations,),
+                        np.shape(value),
                     )
-                interpreter.symtable[key] = result[key] = sample
-            else:
-                interpreter.symtable[key] = result[key] = get_rng_sample(
-                    self.params[key]
                 )
-        return result
+            out[row] = value
+        return out
 
     def __call__(self, ds=None):
         """Evaluate each formula, and update ``exchanges`` if they reference a ``parameter`` name."""
@@ -217,11 +1095,12 @@ class ParameterSet(object):
 
         self.evaluate_and_set_amount_field()
 
-        # Evaluate formulas in exchanges
-        interpreter = self.get_interpreter()
-        for obj in ds:
-            if "formula" in obj and "amount" not in obj:
-                obj["amount"] = interpreter(obj["formula"])
+        # Evaluate formulas in exchanges, with the amounts written into the parameters
+        interpreter = self.get_interpreter(evaluate_first=False)
+        exchanges = [obj for obj in ds if "formula" in obj and "amount" not in obj]
+        values = {key: interpreter.symtable[key] for key in self.order}
+        for obj, amount in zip(exchanges, self.evaluate_exchanges(exchanges, values)):
+            obj["amount"] = amount
 
         # Changes in-place, but return anyway
         return ds
@@ -242,45 +1121,116 @@ class ParameterSet(object):
 
 
 class PintParameterSet(ParameterSet):
-    def __init__(self, params, global_params=None, interpreter=None):
+    interpreter_class = PintInterpreter
+
+    def __init__(
+        self, params, global_params=None, interpreter=None, validate_global_params=True
+    ):
         super().__init__(
             params=params,
             global_params=global_params,
-            interpreter=interpreter or PintInterpreter(),
+            interpreter=interpreter,
+            validate_global_params=validate_global_params,
         )
+        self.unit_symbols = {}
+        for value in self.params.values():
+            self.install_unit_symbols(value.get("formula"))
+        self._folded = None
 
-    def get_references(self):
-        """Create dictionary of parameter references"""
-        refs = {
-            key: self.interpreter.get_unknown_symbols(
-                value.get("formula"),
-                no_pint_units=self.all_param_names,  # ensures that parameter names are not accidentally parsed as units
-            )
-            for key, value in self.params.items()
-        }
-        refs.update({key: set() for key in self.global_params})
-        return refs
+    def sample_inputs(self, iterations, seeded_random=None, exclude=()):
+        """Draw Monte Carlo samples like ``ParameterSet.sample_inputs``.
 
-    def evaluate(self):
-        """Evaluate each formula. Returns dictionary of parameter names and values."""
-        result = {}
-        for key in self.order:
-            if key in self.global_params:
-                value = self.global_params[key]
-            elif self.params[key].get("formula"):
-                value = self.interpreter(self.params[key]["formula"])
-            elif "amount" in self.params[key]:
-                value = self.params[key]["amount"]
-                value = PintWrapper.to_quantity(
-                    value, self.params[key].get("unit")
-                )  # add unit if given
-            else:
-                raise ValueError(
-                    "No suitable formula or static amount found " "in {}".format(key)
+        Uncertainty data is taken as magnitudes in the ``unit`` of the parameter, and
+        the sampled array of each parameter with a unit is wrapped in a single
+        ``pint.Quantity``."""
+        samples = super().sample_inputs(
+            iterations, seeded_random=seeded_random, exclude=exclude
+        )
+        for key, value in self.params.items():
+            if key in samples and not value.get("formula") and value.get("unit"):
+                samples[key] = PintWrapper.to_quantity(samples[key], value["unit"])
+        return samples
+
+    def get_constant_inputs(self):
+        """Get the constant inputs like ``ParameterSet.get_constant_inputs``, with the
+        ``unit`` of each parameter"""
+        constants = super().get_constant_inputs()
+        for key, value in self.params.items():
+            if key in constants and value.get("unit"):
+                constants[key] = PintWrapper.to_quantity(constants[key], value["unit"])
+        return constants
+
+    def install_unit_symbols(self, formula):
+        """Add the pint units used in ``formula`` to ``unit_symbols`` and to the
+        interpreter symtable.
+
+        Formulas of the set are then evaluated without looking up units on every
+        evaluation.
+        """
+        units = self.interpreter.get_pint_symbols(
+            formula, known_symbols=self.all_param_names, ignore_symtable=False
+        )
+        self.interpreter.add_symbols(units)
+        # Units already in the symtable, e.g. from ``PintInterpreter(units=...)``
+        symtable = self.interpreter.symtable
+        for name in self.interpreter.get_symbols(formula):
+            if name not in self.all_param_names and isinstance(
+                symtable.get(name), PintWrapper.Unit
+            ):
+                units[name] = symtable[name]
+        self.unit_symbols.update(units)
+
+    def interpret(self, formula):
+        """Evaluate ``formula`` with the interpreter, skipping the unit lookup done in
+        ``install_unit_symbols``"""
+        return self.interpreter(formula, discover_units=False)
+
+    def update(self, changes):
+        """Install the units of new formulas, then update as in
+        ``ParameterSet.update``."""
+        for value in changes.values():
+            if isinstance(value, str):
+                self.install_unit_symbols(value)
+        self._folded = None
+        return super().update(changes)
+
+    def fold_units(self):
+        """Infer the unit of every parameter once, and return a ``FoldedParameterSet``
+        which evaluates on plain magnitudes and re-attaches the units to its results.
+
+        Raises ``DimensionalityError`` if a formula combines incompatible units, and
+        ``UnsupportedFormula`` if the units of a formula can't be inferred statically
+        (the set can then still be evaluated normally). The folded set is cached until
+        the next ``update``."""
+        if self._folded is None:
+            self._folded = FoldedParameterSet(self)
+        return self._folded
+
+    def clone(self):
+        other = super().clone()
+        other._folded = None
+        return other
+
+    def get_formula_references(self, formula):
+        """Get the set of names used in ``formula`` which are parameters of this set or
+        neither known to the interpreter nor pint units"""
+        return self.interpreter.get_unknown_symbols(
+            formula,
+            # ensures that parameter names are not accidentally parsed as units
+            no_pint_units=self.all_param_names,
+        ).union(
+            self.all_param_names.intersection(self.interpreter.get_symbols(formula))
+        )
+
+    def evaluate_parameter(self, key):
+        """Evaluate a single parameter. Static amounts are returned as ``pint.Quantity``
+        if a unit is given."""
+        if key not in self.global_params and not self.params[key].get("formula"):
+            if "amount" in self.params[key]:
+                return PintWrapper.to_quantity(
+                    self.params[key]["amount"], self.params[key].get("unit")
                 )
-            result[key] = value
-            self.interpreter.add_symbols({key: value})
-        return result
+        return super().evaluate_parameter(key)
 
     def evaluate_and_set_amount_field(self):
         """
@@ -294,3 +1244,38 @@ class PintParameterSet(ParameterSet):
                 quantity=result[key],
             )
         return result
+
+
+def _evaluate_clone(parameter_set, method, kwargs):
+    return getattr(parameter_set.clone(), method)(**kwargs)
+
+
+def evaluate_many(parameter_sets, executor=None, method="evaluate", **kwargs):
+    """Evaluate many independent parameter sets concurrently, and return their results
+    in input order.
+
+    Each task calls ``method`` (e.g. ``"evaluate_monte_carlo"``) with ``kwargs`` on a
+    ``ParameterSet.clone``, so tasks don't share any interpreter or evaluation state,
+    and the given sets are not modified. The same set, or sets sharing an interpreter,
+    can be passed more than once.
+
+    ``executor`` is a thread based ``concurrent.futures.Executor``; by default, a
+    ``ThreadPoolExecutor`` is created for this call. Interpreters can't be pickled, so
+    a ``ProcessPoolExecutor`` raises ``TypeError``; use the ``processes`` argument of
+    ``evaluate_monte_carlo`` for multiprocessing instead. The parsed formula,
+    preprocessor and unit caches are shared by all threads and locked; formulas,
+    parameter dictionaries and global parameters are only read. Calling ``evaluate``,
+    ``update`` or ``get_interpreter`` directly on a set (or on sets sharing an
+    interpreter) from several threads is not safe.
+    """
+    parameter_sets = list(parameter_sets)
+    if executor is None:
+        with ThreadPoolExecutor() as executor:
+            return evaluate_many(parameter_sets, executor, method, **kwargs)
+    if isinstance(executor, ProcessPoolExecutor):
+        raise TypeError("Parameter sets can't be sent to a ``ProcessPoolExecutor``")
+    futures = [
+        executor.submit(_evaluate_clone, parameter_set, method, kwargs)
+        for parameter_set in parameter_sets
+    ]
+    return [future.result() for future in futures]
@@ -4,6 +4,12 @@ import pint.util
 from pint import DimensionalityError, Quantity, UndefinedUnitError, UnitRegistry
 from pint.util import string_preprocessor
 
+from .cache import LRUCache
+
+# Marks strings missing from the unit cache, as ``None`` is cached for strings which are
+# no unit
+NOT_CACHED = object()
+
 
 class PintWrapperSingleton:
     def __new__(cls):
@@ -21,6 +27,8 @@ class PintWrapperSingleton:
             self.ureg.define("unit = [] = dimensionless")
             self.UndefinedUnitError = UndefinedUnitError
             self.DimensionalityError = DimensionalityError
+            self.unit_cache = LRUCache(maxsize=8192)
+            self._definitions = self.count_definitions()
             # manual fix for pint parser (see https://github.com/hgrecco/pint/pull/1701)
 
             pint.util._subs_re_list[-1] = (  # noqa
@@ -32,17 +40,46 @@ class PintWrapperSingleton:
                 for a, b in pint.util._subs_re_list  # noqa
             ]
 
+    def count_definitions(self):
+        """Number of units and prefixes in the unit registry; changes when new units are
+        defined. Reads private attributes of ``pint.UnitRegistry``, and raises
+        ``AttributeError`` if they are missing instead of silently never invalidating
+        the unit cache."""
+        return len(self.ureg._units) + len(self.ureg._prefixes)
+
+    def define(self, definition):
+        """Add a definition to the unit registry, and clear the unit cache"""
+        self.ureg.define(definition)
+        self.unit_cache.invalidate()
+        self._definitions = self.count_definitions()
+
+    def unit_cache_info(self):
+        """Returns hits, misses, maximum and current size of the cache used by
+        ``to_unit``."""
+        return self.unit_cache.info()
+
     def to_unit(self, string, raise_errors=False):
-        """Returns pint.Unit if the given string can be interpreted as a unit, returns None otherwise"""
+        """Returns pint.Unit if the given string can be interpreted as a unit, returns
+        None otherwise.
+
+        Units and strings which are no unit are both memoized in ``unit_cache``, which
+        is invalidated when the number of definitions in the unit registry changes."""
         if string is None:
             return None
-        try:
-            return self.Unit(string)
-        except self.UndefinedUnitError:
-            if raise_errors:
-                raise self.UndefinedUnitError
-            else:
-                return None
+        definitions = self.count_definitions()
+        if definitions != self._definitions:
+            self.unit_cache.invalidate()
+            self._definitions = definitions
+        unit = self.unit_cache.get(string, NOT_CACHED)
+        if unit is NOT_CACHED:
+            try:
+                unit = self.Unit(string)
+            except self.UndefinedUnitError:
+                unit = None
+            self.unit_cache[string] = unit
+        if unit is None and raise_errors:
+            raise self.UndefinedUnitError(string)
+        return unit
 
     def to_units(self, iterable, raise_errors=False, drop_none=True):
         """
@@ -0,0 +1,81 @@
+import json
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+
+SAMPLES_FILENAME = "samples.npy"
+NAMES_FILENAME = "names.json"
+
+
+def write_monte_carlo(
+    parameter_set, dirpath, iterations=1000, chunk_size=1000, seed=None
+):
+    """Evaluate ``parameter_set`` using Monte Carlo and write the results into directory
+    ``dirpath``.
+
+    Results are written block by block (see ``ParameterSet.iter_monte_carlo``) directly
+    into a memory-mapped ``samples.npy`` array with one row per parameter, so they never
+    have to fit in memory. Parameter names are stored in ``names.json``, in the same
+    order as the rows.
+
+    Returns a ``MonteCarloStore`` for ``dirpath``."""
+    dirpath = Path(dirpath)
+    dirpath.mkdir(parents=True, exist_ok=True)
+    names = list(parameter_set.order)
+    samples = np.lib.format.open_memmap(
+        dirpath / SAMPLES_FILENAME,
+        mode="w+",
+        dtype=np.float64,
+        shape=(len(names), iterations),
+    )
+    for _ in parameter_set.iter_monte_carlo(
+        iterations, chunk_size=chunk_size, seed=seed, out=samples
+    ):
+        pass
+    samples.flush()
+    del samples
+    with open(dirpath / NAMES_FILENAME, "w") as f:
+        json.dump(names, f)
+    return MonteCarloStore(dirpath)
+
+
+class MonteCarloStore(Mapping):
+    """Read-only mapping of ``{parameter name: numpy array}`` for Monte Carlo results
+    written by ``write_monte_carlo``.
+
+    The samples file is opened lazily as a memory map; each value is a zero-copy view of
+    one row.
+    """
+
+    def __init__(self, dirpath):
+        self.dirpath = Path(dirpath)
+        self._index = None
+        self._samples = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            with open(self.dirpath / NAMES_FILENAME) as f:
+                self._index = {name: row for row, name in enumerate(json.load(f))}
+        return self._index
+
+    @property
+    def samples(self):
+        """Two-dimensional memory-mapped array with one row per parameter"""
+        if self._samples is None:
+            self._samples = np.load(self.dirpath / SAMPLES_FILENAME, mmap_mode="r")
+        return self._samples
+
+    @property
+    def iterations(self):
+        return self.samples.shape[1]
+
+    def __getitem__(self, name):
+        return self.samples[self.index[name]]
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
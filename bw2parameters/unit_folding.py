@@ -0,0 +1,273 @@
+import ast
+from numbers import Number
+
+import numpy as np
+from astunparse import unparse
+
+from .compiler import get_formula_expression
+from .errors import UnsupportedFormula
+from .pint import PintWrapper
+
+# Functions whose result has the units of their (only) argument
+UNIT_PRESERVING = {"abs", "absolute", "fabs", "ceil", "floor", "round", "rint"}
+# Functions which require dimensionless arguments and return dimensionless results
+DIMENSIONLESS = {
+    "exp",
+    "expm1",
+    "log",
+    "log10",
+    "log2",
+    "log1p",
+    "sin",
+    "cos",
+    "tan",
+    "arcsin",
+    "arccos",
+    "arctan",
+    "arctan2",
+    "sinh",
+    "cosh",
+    "tanh",
+    "arcsinh",
+    "arccosh",
+    "arctanh",
+}
+
+
+def conversion_factor(from_unit, to_unit):
+    """Factor converting magnitudes in ``from_unit`` to ``to_unit``; raises
+    ``DimensionalityError`` if the units are incompatible and ``UnsupportedFormula`` for
+    units with an offset (like degrees Celsius)
+    """
+    for unit in (from_unit, to_unit):
+        if PintWrapper.Quantity(0.0, unit).to_base_units().m != 0:
+            raise UnsupportedFormula("Can't fold units with offset: {}".format(unit))
+    return PintWrapper.Quantity(1.0, from_unit).to(to_unit).m
+
+
+def scaled(node, factor):
+    """``node`` multiplied by ``factor``, unless ``factor`` is one"""
+    if factor == 1:
+        return node
+    return ast.BinOp(left=node, op=ast.Mult(), right=ast.Constant(value=factor))
+
+
+class UnitFolder(object):
+    """Infer the units of all parameters of a ``PintParameterSet`` and rewrite its
+    formulas to work on magnitudes.
+
+    Each value is treated as a magnitude in a known unit, or as a plain number (unit
+    ``None``). Multiplication, division and powers with constant exponents combine
+    units; additions, subtractions and function arguments get the conversion factors
+    needed to bring them into the same unit as pint would. Incompatible dimensions raise
+    ``DimensionalityError`` when folding, and formulas outside of this subset raise
+    ``UnsupportedFormula``.
+    """
+
+    def __init__(self, parameter_set):
+        self.parameter_set = parameter_set
+        self.interpreter = parameter_set.interpreter
+        self.units = {}
+        self.formulas = {}
+        for key in parameter_set.order:
+            if key in parameter_set.global_params:
+                value = parameter_set.global_params[key]
+                self.units[key] = value.u if PintWrapper.is_quantity(value) else None
+            elif parameter_set.params[key].get("formula"):
+                tree = self.interpreter.parse_cached(
+                    parameter_set.params[key]["formula"]
+                ).tree
+                unit, node = self.fold(get_formula_expression(tree, key))
+                self.units[key] = unit
+                self.formulas[key] = unparse(node).strip()
+            else:
+                unit = parameter_set.params[key].get("unit")
+                self.units[key] = PintWrapper.Unit(unit) if unit else None
+
+    def to_dimensionless(self, unit, node):
+        if unit is None:
+            return node
+        return scaled(node, conversion_factor(unit, "dimensionless"))
+
+    def fold(self, node):
+        """Returns ``(unit or None, node operating on magnitudes)``"""
+        if isinstance(node, ast.Constant) and isinstance(node.value, Number):
+            return None, node
+        elif isinstance(node, ast.Name):
+            if node.id in self.units:
+                return self.units[node.id], node
+            elif node.id in self.parameter_set.unit_symbols:
+                return self.parameter_set.unit_symbols[node.id], ast.Constant(value=1)
+            elif isinstance(self.interpreter.symtable.get(node.id), Number):
+                return None, node
+        elif isinstance(node, ast.UnaryOp) and isinstance(
+            node.op, (ast.USub, ast.UAdd)
+        ):
+            unit, operand = self.fold(node.operand)
+            return unit, ast.UnaryOp(op=node.op, operand=operand)
+        elif isinstance(node, ast.BinOp):
+            return self.fold_binop(node)
+        elif (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and not node.keywords
+        ):
+            return self.fold_call(node)
+        raise UnsupportedFormula("Can't fold units of {}".format(unparse(node).strip()))
+
+    def fold_binop(self, node):
+        left_unit, left = self.fold(node.left)
+        right_unit, right = self.fold(node.right)
+        if isinstance(node.op, (ast.Add, ast.Sub)):
+            if left_unit is None and right_unit is None:
+                unit = None
+            elif left_unit is None:
+                unit = right_unit
+                left = scaled(left, conversion_factor("dimensionless", unit))
+            else:
+                unit = left_unit
+                right = scaled(
+                    right, conversion_factor(right_unit or "dimensionless", unit)
+                )
+        elif isinstance(node.op, (ast.Mult, ast.Div)):
+            for operand_unit in (left_unit, right_unit):
+                if operand_unit is not None:
+                    conversion_factor(operand_unit, operand_unit)  # Reject offsets
+            if left_unit is None or right_unit is None:
+                unit = left_unit or right_unit
+            elif isinstance(node.op, ast.Mult):
+                unit = left_unit * right_unit
+            else:
+                unit = left_unit / right_unit
+            if isinstance(node.op, ast.Div) and left_unit is None and unit is not None:
+                unit = unit**-1
+        elif isinstance(node.op, ast.Pow):
+            exponent = self.constant(right)
+            if right_unit is not None:
+                right = self.to_dimensionless(right_unit, right)
+                exponent = None
+            if left_unit is None:
+                unit = None if right_unit is None else PintWrapper.Unit("")
+            elif exponent is not None:
+                unit = left_unit**exponent
+            elif right_unit is None:
+                # The unit of the result depends on the value of the exponent
+                raise UnsupportedFormula(
+                    "Can't fold units of {}".format(unparse(node).strip())
+                )
+            else:
+                left = self.to_dimensionless(left_unit, left)
+                unit = PintWrapper.Unit("")
+        else:
+            raise UnsupportedFormula(
+                "Can't fold units of {}".format(unparse(node).strip())
+            )
+        return unit, ast.BinOp(left=left, op=node.op, right=right)
+
+    def fold_call(self, node):
+        name = node.func.id
+        function = self.interpreter.symtable.get(name)
+        folded = [self.fold(arg) for arg in node.args]
+        units = [unit for unit, _ in folded]
+        if name == "sqrt" and len(folded) == 1:
+            unit, arg = folded[0]
+            return (None if unit is None else unit**0.5), ast.Call(
+                func=node.func, args=[arg], keywords=[]
+            )
+        elif name in UNIT_PRESERVING and len(folded) == 1:
+            unit, arg = folded[0]
+            if unit is not None:
+                conversion_factor(unit, unit)
+            return unit, ast.Call(func=node.func, args=[arg], keywords=[])
+        elif name in DIMENSIONLESS and isinstance(function, np.ufunc):
+            args = [self.to_dimensionless(unit, arg) for unit, arg in folded]
+            unit = None if all(unit is None for unit in units) else PintWrapper.Unit("")
+            return unit, ast.Call(func=node.func, args=args, keywords=[])
+        raise UnsupportedFormula("Can't fold units of {}".format(unparse(node).strip()))
+
+    @staticmethod
+    def constant(node):
+        """Numeric value of a constant (possibly negated) node, or ``None``"""
+        if isinstance(node, ast.Constant) and isinstance(node.value, Number):
+            return node.value
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            value = UnitFolder.constant(node.operand)
+            return None if value is None else -value
+        return None
+
+
+class FoldedParameterSet(object):
+    """Unit-free ``ParameterSet`` equivalent to a ``PintParameterSet``, plus the units
+    of its parameters.
+
+    Formulas are rewritten by ``UnitFolder`` and evaluated on plain magnitudes; the
+    units are re-attached to the results of ``evaluate``, ``evaluate_monte_carlo`` and
+    ``evaluate_scenarios``. Static amounts and uncertainty data are magnitudes in the
+    ``unit`` of their parameter, as in ``PintParameterSet``.
+    """
+
+    def __init__(self, pint_parameter_set):
+        from .parameter_set import ParameterSet
+
+        folder = UnitFolder(pint_parameter_set)
+        self.units = folder.units
+        params = {
+            key: (
+                {"formula": folder.formulas[key]}
+                if key in folder.formulas
+                else pint_parameter_set.params[key]
+            )
+            for key in pint_parameter_set.params
+        }
+        global_params = {
+            key: value.m if PintWrapper.is_quantity(value) else value
+            for key, value in pint_parameter_set.global_params.items()
+        }
+        # User symbols of the source interpreter, except the units folded into the
+        # formulas
+        symtable = pint_parameter_set.interpreter.symtable
+        interpreter = ParameterSet.interpreter_class.from_template()
+        interpreter.add_symbols(
+            {
+                key: symtable[key]
+                for key in pint_parameter_set.interpreter.user_defined_symbols()
+                if not isinstance(symtable[key], PintWrapper.Unit)
+            }
+        )
+        self.parameter_set = ParameterSet(
+            params, global_params, interpreter=interpreter
+        )
+
+    def attach_units(self, result):
+        return {
+            key: (
+                value
+                if self.units[key] is None
+                else PintWrapper.Quantity(value, self.units[key])
+            )
+            for key, value in result.items()
+        }
+
+    def evaluate(self, compiled=False):
+        return self.attach_units(self.parameter_set.evaluate(compiled=compiled))
+
+    def evaluate_monte_carlo(self, *args, **kwargs):
+        return self.attach_units(
+            self.parameter_set.evaluate_monte_carlo(*args, **kwargs)
+        )
+
+    def evaluate_scenarios(self, scenarios, names=None):
+        """Like ``ParameterSet.evaluate_scenarios``; overriding ``pint.Quantity`` values
+        are converted into the unit of their parameter"""
+        if isinstance(scenarios, dict):
+            scenarios = {
+                key: (
+                    value.to(self.units[key]).m
+                    if PintWrapper.is_quantity(value)
+                    else value
+                )
+                for key, value in scenarios.items()
+            }
+        return self.attach_units(
+            self.parameter_set.evaluate_scenarios(scenarios, names=names)
+        )
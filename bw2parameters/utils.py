@@ -28,6 +28,52 @@ def isidentifier(ident):
     return True
 
 
+def strongly_connected_components(graph):
+    """Find the strongly connected components of a directed ``graph`` given as
+    ``{node: [successors]}``.
+
+    Iterative version of Tarjan's algorithm; all successors must be keys of ``graph``.
+
+    Returns a list of sets of nodes."""
+    index, lowlink = {}, {}
+    stack, on_stack = [], set()
+    components = []
+
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(graph[successor])))
+                    break
+                elif successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.add(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
 def get_version_tuple() -> tuple:
     def as_integer(x: str) -> Union[int, str]:
         try:
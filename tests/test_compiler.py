@@ -0,0 +1,58 @@
+import pytest
+
+from bw2parameters import ParameterSet
+from bw2parameters.errors import UnsupportedFormula
+
+params = {
+    "Agrajag": {"amount": 3.14},
+    "Constant_Mown": {"amount": 0.001},
+    "Deep_Thought": {"amount": 42},
+    "East_River_Creature": {"formula": "2 * Agrajag ** 2"},
+    "Eccentrica_Gallumbits": {"formula": "1 / sqrt(Constant_Mown)"},
+    "Elders_of_Krikkit": {"formula": "East_River_Creature + Eccentrica_Gallumbits"},
+    "Emily_Saunders": {"formula": "sin(Deep_Thought) + 7 - Elders_of_Krikkit"},
+    "Gag_Halfrunt": {
+        "formula": "Deep_Thought + Constant_Mown - log10(abs(Emily_Saunders))"
+    },
+    "Gargravarr": {"formula": "Zaphod if Zaphod > 1 else -Zaphod"},
+}
+
+
+def test_compiled_evaluation():
+    ps = ParameterSet(params, {"Zaphod": 2})
+    compiled = ps.evaluate(compiled=True)
+    assert compiled == ParameterSet(params, {"Zaphod": 2}).evaluate()
+    with ps.scope() as interpreter:
+        assert interpreter("Gargravarr") == 2
+    assert ps.compile() is ps.compile()
+    assert ps.compile().inputs == [
+        key
+        for key in ps.order
+        if key in {"Agrajag", "Constant_Mown", "Deep_Thought", "Zaphod"}
+    ]
+
+
+def test_compiled_uses_current_amounts():
+    ps = ParameterSet(
+        {
+            "Deep_Thought": {"amount": 42},
+            "East_River_Creature": {"formula": "2 * Deep_Thought + 16"},
+        }
+    )
+    assert ps.evaluate(compiled=True)["East_River_Creature"] == 100
+    ps.params["Deep_Thought"]["amount"] = 0
+    assert ps.evaluate(compiled=True)["East_River_Creature"] == 16
+    compiled = ps.compile()
+    ps.update({"East_River_Creature": "Deep_Thought - 1"})
+    assert ps.compile() is not compiled
+    assert ps.evaluate(compiled=True)["East_River_Creature"] == -1
+
+
+@pytest.mark.parametrize(
+    "formula",
+    ["Deep_Thought.real", "(lambda: Deep_Thought)()", "{Deep_Thought: 1}[42]"],
+)
+def test_compile_unsupported(formula):
+    ps = ParameterSet({"Deep_Thought": {"amount": 42}, "Agrajag": {"formula": formula}})
+    with pytest.raises(UnsupportedFormula):
+        ps.compile()
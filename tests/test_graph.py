@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bw2parameters import ParameterGraph, PintParameterSet, PintWrapper
+from bw2parameters.errors import ParameterError
+
+
+def get_graph(**kwargs):
+    return ParameterGraph(
+        project={"rate": {"amount": 2}, "scale": {"formula": "rate * 10"}},
+        databases={
+            "db": {"scale": {"formula": "rate * 100"}, "offset": {"amount": 1}},
+            "other": {},
+        },
+        groups={
+            ("db", "a"): {"x": {"formula": "scale + offset"}},
+            ("db", "b"): {"x": {"amount": 3}, "y": {"formula": "x * rate"}},
+            ("other", "a"): {"x": {"formula": "scale + 1"}},
+        },
+        **kwargs
+    )
+
+
+def test_graph_evaluate():
+    assert get_graph().evaluate() == {
+        "project": {"rate": 2, "scale": 20},
+        "databases": {"db": {"scale": 200, "offset": 1}, "other": {}},
+        "groups": {
+            ("db", "a"): {"x": 201},
+            ("db", "b"): {"x": 3, "y": 6},
+            ("other", "a"): {"x": 21},
+        },
+    }
+
+
+def test_graph_evaluates_upstream_once(monkeypatch):
+    graph = get_graph()
+    calls = []
+    evaluate_level = graph.evaluate_level
+    monkeypatch.setattr(
+        graph,
+        "evaluate_level",
+        lambda params, upstream: calls.append(params)
+        or evaluate_level(params, upstream),
+    )
+    graph.evaluate()
+    graph.evaluate()
+    assert len(calls) == 3
+    graph.clear()
+    graph.evaluate()
+    assert len(calls) == 6
+
+
+def test_graph_group_globals():
+    graph = get_graph()
+    parameter_set = graph.get_parameter_set(
+        graph.groups[("db", "b")], graph.get_upstream_values("db")
+    )
+    assert parameter_set.global_params == {"rate": 2}
+
+
+def test_graph_executor():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert get_graph().evaluate(executor) == get_graph().evaluate()
+
+
+def test_graph_undefined_name():
+    graph = ParameterGraph(groups={("db", "a"): {"x": {"formula": "missing * 2"}}})
+    with pytest.raises(ParameterError):
+        graph.evaluate()
+
+
+def test_graph_pint():
+    graph = ParameterGraph(
+        project={"length": {"amount": 2, "unit": "m"}},
+        groups={("db", "a"): {"area": {"formula": "length * 50 cm"}}},
+        parameter_set_class=PintParameterSet,
+    )
+    result = graph.evaluate()["groups"][("db", "a")]["area"]
+    assert result.to("m**2") == PintWrapper.Quantity(1, "m**2")
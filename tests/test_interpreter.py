@@ -1,6 +1,13 @@
+import numpy as np
 import pytest
 
-from bw2parameters import Interpreter, MissingName
+from bw2parameters import (
+    Interpreter,
+    InterpreterPool,
+    MissingName,
+    ParameterSet,
+    PintInterpreter,
+)
 
 
 def test_init():
@@ -68,3 +75,95 @@ def test_eval():
         i("1 + a + b")
     assert i("1 + b") == 4
     assert i("1 + a + b", known_symbols={"a": 2}) == 6
+
+
+def test_formula_cache_shared():
+    Interpreter.formula_cache.clear()
+    i, j = Interpreter(), Interpreter()
+    assert i.get_symbols("x * y + 2") == {"x", "y"}
+    assert i.formula_cache_info().misses == 1
+    assert j.get_unknown_symbols("x * y + 2") == {"x", "y"}
+    assert j("x * y + 2", known_symbols={"x": 2, "y": 3}) == 8
+    info = Interpreter.formula_cache_info()
+    assert info.misses == 1
+    assert info.hits == 2
+    assert info.currsize == 1
+
+
+def test_formula_cache_size_limit():
+    Interpreter.formula_cache.clear()
+    maxsize = Interpreter.formula_cache.maxsize
+    try:
+        Interpreter.formula_cache.maxsize = 2
+        i = Interpreter()
+        for formula in ("a + 1", "a + 2", "a + 3"):
+            i.get_symbols(formula)
+        assert Interpreter.formula_cache_info().currsize == 2
+        assert "a + 1" not in Interpreter.formula_cache
+    finally:
+        Interpreter.formula_cache.maxsize = maxsize
+
+
+def test_from_template():
+    first, second = Interpreter.from_template(), Interpreter.from_template()
+    assert first.symtable is not second.symtable
+    assert first.symtable.keys() == Interpreter().symtable.keys()
+    first.add_symbols({"a": 2})
+    assert first("a * sqrt(4)") == 4
+    assert "a" not in second.symtable
+    assert not second.user_defined_symbols()
+    assert isinstance(PintInterpreter.from_template(), PintInterpreter)
+    assert first.node_handlers["binop"].__self__ is first
+
+
+def test_parameter_set_interpreters_independent():
+    first = ParameterSet({"a": {"amount": 1}})
+    second = ParameterSet({"a": {"amount": 2}})
+    first.evaluate()
+    assert second.evaluate() == {"a": 2}
+    with first.scope() as interpreter:
+        assert interpreter("a") == 1
+
+
+def test_interpreter_pool():
+    pool = InterpreterPool(maxsize=1)
+    with pool.interpreter() as interpreter:
+        interpreter.add_symbols({"a": 1})
+        assert interpreter("a + 1") == 2
+    with pool.interpreter() as other:
+        assert other is interpreter
+        assert not other.user_defined_symbols()
+        assert "sqrt" in other.symtable
+        other.add_symbols({"pi": 3})
+    with pool.interpreter() as interpreter:
+        assert interpreter("pi") == np.pi
+        assert interpreter("print") == interpreter._printer
+
+
+def test_scope():
+    i = Interpreter()
+    i.add_symbols({"a": 1})
+    with i.scope({"b": 2}, {"a": 3, "b": 4}) as interpreter:
+        assert interpreter is i
+        assert i("a + b") == 5
+        i("c = 10")
+        i.add_symbols({"d": 1})
+    assert "b" not in i.symtable and "c" not in i.symtable
+    assert i.user_defined_symbols() == {"a", "d"}
+    assert i("a", known_symbols={"a": 7}) == 7
+    assert i("a") == 1
+
+
+def test_parameter_set_values_dont_leak():
+    interpreter = Interpreter()
+    first = ParameterSet(
+        {"a": {"amount": 1}, "b": {"formula": "a * 2"}}, interpreter=interpreter
+    )
+    second = ParameterSet(
+        {"a": {"amount": 5}, "b": {"formula": "a * 3"}}, interpreter=interpreter
+    )
+    assert first.evaluate() == {"a": 1, "b": 2}
+    assert second.evaluate() == {"a": 5, "b": 15}
+    assert not interpreter.user_defined_symbols()
+    assert first.update({"a": 2}) == {"a", "b"}
+    assert first.evaluate() == {"a": 2, "b": 4}
@@ -0,0 +1,78 @@
+import ast
+
+import numpy as np
+import pytest
+
+from bw2parameters import Interpreter, ParameterSet, kernels
+from bw2parameters.errors import UnsupportedFormula
+from bw2parameters.kernels import ArrayKernel
+
+params = {
+    "Agrajag": {"amount": 3.14},
+    "Constant_Mown": {
+        "amount": 0.001,
+        "uncertainty_type": 3,
+        "loc": 0.001,
+        "scale": 0.2,
+        "minimum": 0,
+    },
+    "Deep_Thought": {
+        "amount": 42,
+        "uncertainty type": 5,
+        "minimum": 30,
+        "maximum": 70,
+    },
+    "East_River_Creature": {"formula": "2 * Agrajag ** 2 + Deep_Thought"},
+    "Eccentrica_Gallumbits": {"formula": "1 / sqrt(Constant_Mown)"},
+    "Elders_of_Krikkit": {
+        "formula": "-(East_River_Creature - 1) // (Eccentrica_Gallumbits % 3)"
+    },
+    "Emily_Saunders": {"formula": "sin(Deep_Thought) + 7 - Elders_of_Krikkit"},
+    "Gag_Halfrunt": {"formula": "where(Deep_Thought > 40, 1, 0) + Emily_Saunders"},
+}
+
+
+@pytest.fixture(params=["numexpr", "ufunc"])
+def backend(request, monkeypatch):
+    if request.param == "ufunc":
+        monkeypatch.setattr(kernels, "numexpr", None)
+    elif kernels.numexpr is None:
+        pytest.skip("numexpr not installed")
+    return request.param
+
+
+def test_fused_monte_carlo(backend):
+    fused = ParameterSet(params).evaluate_monte_carlo(500, seed=1, fused=True)
+    plain = ParameterSet(params).evaluate_monte_carlo(500, seed=1)
+    for key in params:
+        assert fused[key].shape == (500,)
+        assert np.allclose(fused[key], plain[key])
+
+
+def test_fused_writes_into_buffers(backend):
+    ps = ParameterSet(params)
+    for block in ps.iter_monte_carlo(100, chunk_size=100, fused=True):
+        assert ps.get_kernel("East_River_Creature") is not None
+        assert ps.get_kernel("Gag_Halfrunt") is None
+        assert np.allclose(
+            block["East_River_Creature"], 2 * 3.14**2 + block["Deep_Thought"]
+        )
+
+
+def test_ufunc_kernel_reuses_temporaries(monkeypatch):
+    monkeypatch.setattr(kernels, "numexpr", None)
+    symtable = Interpreter().symtable
+    kernel = ArrayKernel(ast.parse("(a + b) * (a - b) + exp(a) / (b + 1)"), symtable)
+    assert kernel.n_temporaries == 2
+    a, b = np.arange(5.0), np.ones(5)
+    out = np.empty(5)
+    assert kernel({**symtable, "a": a, "b": b}, out) is out
+    assert np.allclose(out, (a + b) * (a - b) + np.exp(a) / (b + 1))
+
+
+def test_kernel_unsupported():
+    symtable = Interpreter().symtable
+    with pytest.raises(UnsupportedFormula):
+        ArrayKernel(ast.parse("a if a > 1 else b"), symtable)
+    with pytest.raises(TypeError):
+        ArrayKernel(ast.parse("a * 2"), symtable)({"a": "foo"}, np.empty(2))
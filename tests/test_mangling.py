@@ -44,3 +44,61 @@ def test_chain_prefix_parameter_dict():
     r2 = substitute_in_formulas(r1, s2)
     expected = {"t_a": {"formula": "(t_a + (dog / cat))", "original": "a"}}
     assert r2 == expected
+
+
+def test_bulk_prefix_parameter_dict():
+    given = {
+        "a": {"formula": "a + b / c", "foo": [1]},
+        "b": {"formula": "2 * d - exp(7 - e)"},
+        "catch": {},
+    }
+    expected = {
+        "t_a": {"formula": "t_a + t_b / c", "foo": [1], "original": "a"},
+        "t_b": {"formula": "2 * d - exp(7 - e)", "original": "b"},
+        "t_catch": {"original": "catch"},
+    }
+    substitutions = {"a": "t_a", "b": "t_b", "catch": "t_catch"}
+    result = bulk_prefix_parameter_dict(given, "t_")
+    assert result == (expected, substitutions)
+    assert given["a"] == {"formula": "a + b / c", "foo": [1]}
+    assert result[0]["t_a"]["foo"] is given["a"]["foo"]
+
+
+def test_bulk_substitute_in_formulas():
+    given = {
+        "x": {"formula": "a + b"},
+        "y": {"formula": "a + b"},
+        "z": {"formula": "c"},
+        "w": {"amount": 1},
+    }
+    expected = {
+        "x": {"formula": "dog + b"},
+        "y": {"formula": "dog + b"},
+        "z": {"formula": "c"},
+        "w": {"amount": 1},
+    }
+    assert bulk_substitute_in_formulas(given, {"a": "dog"}) == expected
+
+
+def test_formula_substitutor_tokens():
+    substitutor = FormulaSubstitutor({"a": "t_a", "b": "t_b", "c": "t_c"}, tokens=True)
+    assert substitutor("a + b/c") == "t_a + t_b/t_c"
+    assert substitutor("round(a, ndigits=b) + x.a") == "round(t_a, ndigits=t_b) + x.a"
+    assert substitutor("a == b and c") == "t_a == t_b and t_c"
+    assert substitutor("2 a kg") == "2 t_a kg"
+    # Falls back to the AST
+    assert substitutor("(lambda x: x + b)(c)") == "(lambda x: (x + t_b))(t_c)"
+    assert substitutor("f'{a}' + 'a'") == FormulaSubstitutor(
+        {"a": "t_a", "b": "t_b", "c": "t_c"}
+    )("f'{a}' + 'a'")
+    assert substitutor("a + b") is substitutor("a + b")
+
+
+def test_formula_substitutor_tokens_same_values():
+    interpreter = Interpreter()
+    interpreter.symtable.update({"t_a": 2, "t_b": 3, "t_c": 5})
+    substitutions = {"a": "t_a", "b": "t_b", "c": "t_c"}
+    for formula in ["a + b / c", "-a ** 2 * (b - c)", "sqrt(a) if b > c else exp(c)"]:
+        assert interpreter(FormulaSubstitutor(substitutions)(formula)) == interpreter(
+            FormulaSubstitutor(substitutions, tokens=True)(formula)
+        )
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
+import tracemalloc
 from copy import deepcopy
 
 import numpy as np
 import pytest
+from stats_arrays import UniformUncertainty
 
-from bw2parameters import ParameterSet
+from bw2parameters import Interpreter, ParameterSet
 from bw2parameters.errors import BroadcastingError
+from bw2parameters.parameter_set import materialize
 
 
 def test_monte_carlo_evaluation():
@@ -81,3 +84,296 @@ def test_wrong_shape():
     }
     with pytest.raises(BroadcastingError):
         ParameterSet(params).evaluate_monte_carlo()
+
+
+def test_monte_carlo_grouped_sampling(monkeypatch):
+    calls = []
+    original = UniformUncertainty.bounded_random_variables.__func__
+
+    def counting(cls, params, size, *args, **kwargs):
+        calls.append(params.shape[0])
+        return original(cls, params, size, *args, **kwargs)
+
+    monkeypatch.setattr(
+        UniformUncertainty, "bounded_random_variables", classmethod(counting)
+    )
+    params = {
+        "p{}".format(i): {
+            "amount": i,
+            "uncertainty type": 4,
+            "minimum": i,
+            "maximum": i + 1,
+        }
+        for i in range(50)
+    }
+    params["Agrajag"] = {"amount": 3.14}
+    params["Gargravarr"] = {"formula": "p0 + p49 + Agrajag"}
+    result = ParameterSet(params).evaluate_monte_carlo(100)
+    assert calls == [50]
+    for i in range(50):
+        assert (result["p{}".format(i)] >= i).all()
+        assert (result["p{}".format(i)] <= i + 1).all()
+        assert result["p{}".format(i)].flags.c_contiguous
+        assert result["p{}".format(i)].base is None
+    assert np.allclose(result["Agrajag"], 3.14)
+    assert np.allclose(result["Gargravarr"], result["p0"] + result["p49"] + 3.14)
+    assert "uncertainty_type" not in params["p0"]
+
+
+def test_iter_monte_carlo():
+    params = {
+        "Deep_Thought": {
+            "amount": 5,
+            "uncertainty type": 4,
+            "minimum": 2,
+            "maximum": 8,
+        },
+        "Agrajag": {"amount": 3.14},
+        "East_River_Creature": {"formula": "Agrajag + Deep_Thought"},
+    }
+    ps = ParameterSet(params)
+    blocks, sizes, previous = [], [], None
+    for block in ps.iter_monte_carlo(250, chunk_size=100):
+        sizes.append(block["East_River_Creature"].shape)
+        assert np.allclose(block["East_River_Creature"], block["Deep_Thought"] + 3.14)
+        if previous is not None:
+            assert np.shares_memory(previous, block["Deep_Thought"])
+        previous = block["Deep_Thought"]
+        blocks.append(block["Deep_Thought"].copy())
+    assert sizes == [(100,), (100,), (50,)]
+    samples = np.hstack(blocks)
+    assert ((samples >= 2) & (samples <= 8)).all()
+    assert np.unique(samples).shape[0] > 200
+
+    with pytest.raises(ValueError):
+        next(ps.iter_monte_carlo(10, chunk_size=0))
+
+
+def test_monte_carlo_seed():
+    params = {
+        "Deep_Thought": {
+            "amount": 5,
+            "uncertainty type": 4,
+            "minimum": 2,
+            "maximum": 8,
+        },
+        "Gargravarr": {
+            "amount": 10,
+            "uncertainty_type": 3,
+            "loc": 10,
+            "scale": 1,
+        },
+        "East_River_Creature": {"formula": "Gargravarr * Deep_Thought"},
+    }
+    first = ParameterSet(params).evaluate_monte_carlo(250, seed=42, chunk_size=100)
+    second = ParameterSet(params).evaluate_monte_carlo(250, seed=42, chunk_size=100)
+    other = ParameterSet(params).evaluate_monte_carlo(250, seed=43, chunk_size=100)
+    parallel = ParameterSet(params).evaluate_monte_carlo(
+        250, seed=42, processes=2, chunk_size=100
+    )
+    streamed = np.hstack(
+        [
+            block["East_River_Creature"].copy()
+            for block in ParameterSet(params).iter_monte_carlo(
+                250, chunk_size=100, seed=42
+            )
+        ]
+    )
+    for key in params:
+        assert first[key].shape == (250,)
+        assert np.array_equal(first[key], second[key])
+        assert np.array_equal(first[key], parallel[key])
+        assert not np.array_equal(first[key], other[key])
+    assert np.array_equal(first["East_River_Creature"], streamed)
+
+
+def test_monte_carlo_processes_interpreter_symbols():
+    interpreter = Interpreter()
+    interpreter.add_symbols({"Agrajag": 3})
+    params = {
+        "Deep_Thought": {
+            "amount": 5,
+            "uncertainty type": 4,
+            "minimum": 2,
+            "maximum": 8,
+        },
+        "Marvin": {"formula": "Deep_Thought * Agrajag"},
+    }
+    serial = ParameterSet(params, interpreter=interpreter).evaluate_monte_carlo(
+        50, seed=1, chunk_size=20
+    )
+    parallel = ParameterSet(params, interpreter=interpreter).evaluate_monte_carlo(
+        50, seed=1, processes=2, chunk_size=20
+    )
+    assert np.array_equal(serial["Marvin"], parallel["Marvin"])
+
+
+def test_evaluate_exchanges_monte_carlo():
+    ps = ParameterSet(
+        {
+            "A": {
+                "amount": 1,
+                "uncertainty_type": 4,
+                "minimum": 0.5,
+                "maximum": 1.5,
+            },
+            "B": {"formula": "A * 2"},
+        }
+    )
+    samples = ps.evaluate_monte_carlo(100, seed=1)
+    exchanges = [{"formula": "B + 1"}, {"amount": 3}, "A", {"formula": "B + 1"}, {}]
+    result = ps.evaluate_exchanges_monte_carlo(exchanges, samples=samples)
+    assert result.shape == (5, 100) and result.flags.c_contiguous
+    assert np.allclose(result[0], samples["B"] + 1)
+    assert np.allclose(result[1], 3)
+    assert np.allclose(result[2], samples["A"])
+    assert np.allclose(result[3], result[0])
+    assert np.isnan(result[4]).all()
+    assert ps.evaluate_exchanges_monte_carlo(["B"], iterations=10).shape == (1, 10)
+    targets = ps.evaluate_monte_carlo(20, targets=["B"])
+    result = ps.evaluate_exchanges_monte_carlo(["B * 2"], samples=targets)
+    assert np.allclose(result[0], targets["B"] * 2)
+
+
+def test_evaluate_exchanges_monte_carlo_wrong_shape():
+    ps = ParameterSet({"A": {"amount": 1}})
+    with pytest.raises(BroadcastingError):
+        ps.evaluate_exchanges_monte_carlo(["array([A, A])"], iterations=10)
+
+
+def get_constants_parameter_set():
+    return ParameterSet(
+        {
+            "A": {
+                "amount": 1,
+                "uncertainty_type": 4,
+                "minimum": 0.5,
+                "maximum": 1.5,
+            },
+            "B": {"amount": 2},
+            "C": {"amount": 3, "uncertainty_type": 1, "loc": 3},
+            "D": {"formula": "B * C + G"},
+            "E": {"formula": "A * D"},
+        },
+        {"G": 4},
+    )
+
+
+def test_get_constants():
+    assert get_constants_parameter_set().get_constants() == {
+        "B": 2,
+        "C": 3,
+        "D": 10,
+        "G": 4,
+    }
+
+
+def test_fold_constants():
+    ps = get_constants_parameter_set()
+    expected = ps.evaluate_monte_carlo(100, seed=5)
+    result = ps.evaluate_monte_carlo(100, seed=5, fold_constants=True)
+    assert result.keys() == expected.keys()
+    for key, value in expected.items():
+        assert result[key].shape == (100,)
+        assert np.allclose(result[key], value)
+    assert np.allclose(result["D"], 10)
+
+    blocks = list(ps.iter_monte_carlo(100, chunk_size=40, seed=5, fold_constants=True))
+    expected = ps.evaluate_monte_carlo(100, seed=5, chunk_size=40)
+    assert np.allclose(blocks[-1]["E"], expected["E"][80:])
+    assert np.allclose(blocks[-1]["D"], 10)
+
+
+def test_fold_constants_wrong_shape():
+    ps = ParameterSet({"A": {"amount": 1}, "B": {"formula": "array([A, A])"}})
+    with pytest.raises(BroadcastingError):
+        ps.evaluate_monte_carlo(10, fold_constants=True)
+
+
+def test_lazy_broadcasting():
+    ps = get_constants_parameter_set()
+    expected = ps.evaluate_monte_carlo(100, seed=5)
+    for fold_constants in (False, True):
+        result = ps.evaluate_monte_carlo(
+            100, seed=5, fold_constants=fold_constants, materialize=False
+        )
+        for key in "BCDG" if fold_constants else "BCG":
+            assert result[key].shape == (100,) and result[key].strides == (0,)
+        assert result["E"].strides != (0,)
+        full = materialize(result)
+        for key, value in expected.items():
+            assert np.allclose(full[key], value)
+            assert full[key].flags.writeable
+        assert full["A"] is result["A"]
+
+
+def test_lazy_broadcasting_formula():
+    ps = ParameterSet({"A": {"formula": "2 * 3"}})
+    result = ps.evaluate_monte_carlo(10, materialize=False)
+    assert result["A"].strides == (0,) and np.allclose(result["A"], 6)
+    assert ps.evaluate_monte_carlo(10)["A"].flags.writeable
+
+
+def test_liveness():
+    ps = ParameterSet(
+        {
+            "A": {"amount": 1},
+            "B": {"formula": "A * 2"},
+            "C": {"formula": "B + 1"},
+            "D": {"formula": "B + C"},
+            "E": {"formula": "A * 10"},
+        }
+    )
+    keys, frees = ps.get_liveness(["D"])
+    assert keys == ["A", "B", "C", "D"]
+    assert frees == {"B": ["A"], "D": ["B", "C"]}
+    with pytest.raises(ValueError):
+        ps.get_liveness(["Z"])
+
+
+def test_monte_carlo_targets(monkeypatch):
+    ps = get_constants_parameter_set()
+    expected = ps.evaluate_monte_carlo(100, seed=5, chunk_size=60)
+    result = ps.evaluate_monte_carlo(100, seed=5, chunk_size=60, targets=["E", "B"])
+    assert set(result) == {"E", "B"}
+    assert np.allclose(result["E"], expected["E"])
+
+    dropped = []
+    scope = ps.interpreter.scope
+
+    def record_scope(*layers):
+        dropped.append(layers[0])
+        return scope(*layers)
+
+    monkeypatch.setattr(ps.interpreter, "scope", record_scope)
+    ps.evaluate_monte_carlo(10, targets=["E"])
+    assert set(dropped[-1]) == {"E"}
+
+
+def test_monte_carlo_targets_memory():
+    params = {
+        "p{}".format(i): {
+            "amount": i,
+            "uncertainty type": 4,
+            "minimum": i,
+            "maximum": i + 1,
+        }
+        for i in range(200)
+    }
+    params["X"] = {"formula": "p0 * 2"}
+    params["Y"] = {"formula": "p1 + p2"}
+    ps = ParameterSet(params)
+
+    def peak(**kwargs):
+        tracemalloc.start()
+        try:
+            result = ps.evaluate_monte_carlo(5000, **kwargs)
+            return result, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    full, full_peak = peak()
+    result, targets_peak = peak(targets=["X"])
+    assert set(result) == {"X"}
+    assert ((result["X"] >= 0) & (result["X"] <= 2)).all()
+    assert targets_peak < full_peak / 20
@@ -1,13 +1,15 @@
 # -*- coding: utf-8 -*-
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import numpy as np
 import pytest
 
-from bw2parameters import ParameterSet
+from bw2parameters import Interpreter, ParameterSet, evaluate_many
 from bw2parameters.errors import (
     CapitalizationError,
     DuplicateName,
+    MissingName,
     ParameterError,
     SelfReference,
 )
@@ -170,6 +172,31 @@ def test_circular_reference():
         )
 
 
+def test_circular_reference_reports_cycle_and_undefined():
+    with pytest.raises(ParameterError) as error:
+        ParameterSet(
+            {
+                "Elders_of_Krikkit": {"formula": "2 * Agrajag"},
+                "Agrajag": {"formula": "2 * Elders_of_Krikkit"},
+                "Gag_Halfrunt": {"formula": "Agrajag + Ford_Prefect"},
+                "Deep_Thought": {"amount": 42},
+            }
+        )
+    message = str(error.value)
+    assert "Undefined names:\n['Ford_Prefect']" in message
+    assert "Circular references:\n[['Agrajag', 'Elders_of_Krikkit']]" in message
+
+
+def test_order_long_chain():
+    params = {"p0": {"amount": 1}}
+    params.update(
+        {"p{}".format(i): {"formula": "p{} + 1".format(i - 1)} for i in range(1, 5000)}
+    )
+    ps = ParameterSet(dict(reversed(list(params.items()))))
+    assert ps.order == ["p{}".format(i) for i in range(5000)]
+    assert ps.evaluate()["p4999"] == 5000
+
+
 def test_capitaliation_error():
     with pytest.raises(CapitalizationError):
         ParameterSet(
@@ -235,3 +262,178 @@ def test_evaluate():
         "Elders_of_Krikkit": 10,
         "Deep_Thought": 42,
     }
+
+
+def test_update_amount():
+    ps = ParameterSet(
+        {
+            "Deep_Thought": {"amount": 42},
+            "Agrajag": {"amount": 3},
+            "East_River_Creature": {"formula": "2 * Deep_Thought + 16"},
+            "Elders_of_Krikkit": {"formula": "sqrt(East_River_Creature)"},
+        }
+    )
+    result = ps.evaluate()
+    assert ps.update({"Deep_Thought": 64}) == {
+        "Deep_Thought",
+        "East_River_Creature",
+        "Elders_of_Krikkit",
+    }
+    assert result["Deep_Thought"] == 42 and result["East_River_Creature"] == 100
+    with ps.scope() as interpreter:
+        assert interpreter("Elders_of_Krikkit") == 12
+    assert ps.evaluate()["Elders_of_Krikkit"] == 12
+
+
+def test_update_formula_reorders():
+    ps = ParameterSet(
+        {
+            "Deep_Thought": {"amount": 42},
+            "East_River_Creature": {"formula": "2 * Deep_Thought + 16"},
+            "Elders_of_Krikkit": {"amount": 1},
+            "Agrajag": {"formula": "Elders_of_Krikkit + 1"},
+        }
+    )
+    ps.evaluate()
+    order = ps.order.copy()
+    changed = ps.update({"Deep_Thought": "Agrajag * 10"})
+    assert changed == {"Deep_Thought", "East_River_Creature"}
+    assert ps.order != order
+    positions = {key: index for index, key in enumerate(ps.order)}
+    for key, references in ps.references.items():
+        assert all(positions[name] < positions[key] for name in references)
+    with ps.scope() as interpreter:
+        assert interpreter("East_River_Creature") == 56
+    assert ps.references["Deep_Thought"] == {"Agrajag"}
+
+
+def test_update_circular_reference_rolled_back():
+    params = {
+        "Deep_Thought": {"amount": 42},
+        "East_River_Creature": {"formula": "2 * Deep_Thought + 16"},
+        "Elders_of_Krikkit": {"formula": "sqrt(East_River_Creature)"},
+    }
+    ps = ParameterSet(params)
+    order = ps.order.copy()
+    with pytest.raises(ParameterError):
+        ps.update({"Deep_Thought": "Elders_of_Krikkit + 1"})
+    assert ps.order == order
+    assert ps.references["Deep_Thought"] == set()
+    assert params["Deep_Thought"] == {"amount": 42}
+    with pytest.raises(SelfReference):
+        ps.update({"Deep_Thought": "Deep_Thought + 1"})
+    with pytest.raises(ParameterError):
+        ps.update({"Deep_Thought": "Ford_Prefect + 1"})
+
+
+def test_update_without_evaluation():
+    ps = ParameterSet(
+        {
+            "East_River_Creature": {"formula": "2 * Deep_Thought + 16"},
+        },
+        {"Deep_Thought": 42},
+    )
+    assert ps.update({"Deep_Thought": 2}) == {"Deep_Thought", "East_River_Creature"}
+    with ps.scope() as interpreter:
+        assert interpreter("East_River_Creature") == 20
+
+
+def test_evaluate_scenarios():
+    params = {
+        "Deep_Thought": {"amount": 42},
+        "East_River_Creature": {"formula": "2 * Deep_Thought + Agrajag"},
+        "Elders_of_Krikkit": {"formula": "sqrt(East_River_Creature)"},
+    }
+    ps = ParameterSet(params, {"Agrajag": 16})
+    result = ps.evaluate_scenarios(
+        {"Deep_Thought": [42, 10, 0], "Agrajag": np.array([16, 44, 4])}
+    )
+    assert np.allclose(result["Elders_of_Krikkit"], [10, 8, 2])
+    for index, (amount, agrajag) in enumerate([(42, 16), (10, 44), (0, 4)]):
+        values = ParameterSet(
+            {**params, "Deep_Thought": {"amount": amount}}, {"Agrajag": agrajag}
+        ).evaluate()
+        for key, value in values.items():
+            assert np.allclose(result[key][index], value)
+
+
+def test_evaluate_scenarios_array():
+    ps = ParameterSet(
+        {
+            "Deep_Thought": {"amount": 42},
+            "East_River_Creature": {"formula": "2 * Deep_Thought + 16"},
+        }
+    )
+    array = ps.evaluate_scenarios(
+        np.array([[1.0, 2.0, 3.0, 4.0]]), names=["Deep_Thought"], as_array=True
+    )
+    assert array.shape == (2, 4)
+    assert np.allclose(array[ps.order.index("East_River_Creature")], [18, 20, 22, 24])
+    with pytest.raises(ValueError):
+        ps.evaluate_scenarios({"Deep_Thought": [1, 2], "Ford_Prefect": [1, 2]})
+    with pytest.raises(ValueError):
+        ps.evaluate_scenarios(np.array([[1, 2], [3, 4]]), names=["Deep_Thought"])
+
+
+def test_evaluate_many():
+    interpreter = Interpreter()
+    sets = [
+        ParameterSet(
+            {"a": {"amount": i}, "b": {"formula": "a ** 2 + G"}},
+            {"G": 1},
+            interpreter=interpreter,
+        )
+        for i in range(50)
+    ]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = evaluate_many(sets + sets, executor=executor)
+    assert results == [{"a": i, "b": i**2 + 1, "G": 1} for i in range(50)] * 2
+    assert all(ps._values is None for ps in sets)
+    assert not interpreter.user_defined_symbols()
+
+
+def test_evaluate_many_method():
+    ps = ParameterSet({"a": {"amount": 2}, "b": {"formula": "a * 3"}})
+    results = evaluate_many([ps, ps], method="evaluate_monte_carlo", iterations=10)
+    assert [result["b"].shape for result in results] == [(10,), (10,)]
+    assert np.allclose(results[0]["b"], 6)
+
+
+def test_evaluate_many_process_executor():
+    ps = ParameterSet({"a": {"amount": 2}})
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(TypeError):
+            evaluate_many([ps], executor=executor)
+
+
+def test_evaluate_exchanges():
+    ps = ParameterSet(
+        {"Deep_Thought": {"amount": 42}, "Marvin": {"formula": "Deep_Thought / 2"}}
+    )
+    exchanges = [
+        {"formula": "Marvin + 1"},
+        "sqrt(Deep_Thought * 42)",
+        {"amount": 7},
+        {"formula": "Marvin + 1"},
+        {"formula": "(lambda: Marvin)()"},
+        {},
+    ]
+    assert ps.evaluate_exchanges(exchanges) == [22, 42, 7, 22, 21, None]
+    array = ps.evaluate_exchanges(exchanges, as_array=True)
+    assert array.dtype == np.float64
+    assert np.allclose(array, [22, 42, 7, 22, 21, np.nan], equal_nan=True)
+    assert ps.evaluate_exchanges(["Marvin"], values={"Marvin": 1}) == [1]
+
+
+def test_evaluate_exchanges_missing_name():
+    ps = ParameterSet({"Deep_Thought": {"amount": 42}})
+    with pytest.raises(MissingName):
+        ps.evaluate_exchanges(["Deep_Thought + Zaphod"])
+
+
+def test_evaluate_exchanges_asteval_limits():
+    ps = ParameterSet({"Deep_Thought": {"amount": 42}})
+    with pytest.raises(RuntimeError):
+        ps.evaluate_exchanges(["'ab' * 10**8"])
+    with pytest.raises(RuntimeError):
+        ps.evaluate_exchanges(["9**9**9"])
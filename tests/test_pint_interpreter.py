@@ -75,7 +75,7 @@ def test_eval():
     result = i(text, known_symbols={"g": other_ureg("1 kg")})
     assert result == ureg("201 kg")
     # test known_symbols not permanently added to symtable
-    assert "g" not in i.symtable
+    assert i.symtable["g"] == ureg("1 g")
     assert i("1 kg + 200 g") == ureg("1.2 kg")
     # test unit "unit" defined
     assert i("1 unit") == PintWrapper.Quantity(1, "dimensionless")
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
+from copy import deepcopy
+
+import numpy as np
 import pint
 import pytest
 
-from bw2parameters import PintParameterSet
+from bw2parameters import PintInterpreter, PintParameterSet, PintWrapper
+from bw2parameters.errors import UnsupportedFormula
 
 ureg = pint.UnitRegistry()
 UndefinedUnitError = pint.UndefinedUnitError
@@ -37,3 +41,202 @@ def test_globals():
         "C": ureg("2.4 V"),
         "D": ureg("2.88 V * m^2"),
     }
+
+
+def test_units_resolved_once(monkeypatch):
+    ps = ParameterSet(equations)
+    assert set(ps.unit_symbols) == {"m", "mm", "kg"}
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Units looked up during evaluation")
+
+    monkeypatch.setattr(ps.interpreter, "get_pint_symbols", fail)
+    expected = {
+        "A": ureg("1 m"),
+        "B": ureg("1.2 m"),
+        "C": ureg("1.2 kg"),
+        "D": ureg("1.44 kg * m^2"),
+    }
+    assert ps.evaluate() == expected
+    assert ps.evaluate() == expected
+
+
+def test_update_installs_units():
+    ps = ParameterSet(deepcopy(equations))
+    ps.evaluate()
+    assert ps.update({"A": "2 km"}) == {"A", "B", "C", "D"}
+    assert "km" in ps.unit_symbols
+    with ps.scope() as interpreter:
+        assert interpreter("B") == ureg("2000.2 m")
+
+
+def test_monte_carlo():
+    params = {
+        "A": {
+            "amount": 1,
+            "unit": "m",
+            "uncertainty type": 4,
+            "minimum": 0.5,
+            "maximum": 1.5,
+        },
+        "B": {"formula": "A + 200 mm"},
+        "C": {"formula": "B * kg/m"},
+        "E": {"amount": 3},
+        "F": {"formula": "2 kg"},
+    }
+    result = ParameterSet(params).evaluate_monte_carlo(100)
+    for key in ["A", "B", "C", "F"]:
+        assert PintWrapper.is_quantity_from_same_registry(result[key])
+        assert result[key].shape == (100,)
+    assert result["A"].units == PintWrapper.Unit("m")
+    assert (result["A"].m >= 0.5).all() and (result["A"].m <= 1.5).all()
+    assert np.allclose(result["B"].to("m").m, result["A"].m + 0.2)
+    assert result["C"].units == PintWrapper.Unit("kg")
+    assert np.allclose(result["F"].m, 2)
+    assert isinstance(result["E"], np.ndarray) and np.allclose(result["E"], 3)
+
+
+def test_monte_carlo_blocks():
+    params = {
+        "A": {
+            "amount": 1,
+            "unit": "m",
+            "uncertainty type": 4,
+            "minimum": 0.5,
+            "maximum": 1.5,
+        },
+        "B": {"formula": "A * 2 s"},
+    }
+    result = ParameterSet(params).evaluate_monte_carlo(250, seed=3, chunk_size=100)
+    blocks = list(ParameterSet(params).iter_monte_carlo(250, chunk_size=100, seed=3))
+    assert result["B"].shape == (250,)
+    assert result["B"].units == PintWrapper.Unit("m * s")
+    assert np.allclose(result["B"].m[200:], blocks[-1]["B"].m)
+    assert blocks[-1]["B"].units == PintWrapper.Unit("m * s")
+
+
+def test_fold_units():
+    ps = ParameterSet(equations)
+    folded = ps.fold_units()
+    assert folded is ps.fold_units()
+    assert folded.units["B"] == PintWrapper.Unit("m")
+    assert folded.units["D"] == PintWrapper.Unit("kg * m ** 2")
+    assert "mm" not in folded.parameter_set.params["B"]["formula"]
+    result = folded.evaluate()
+    for key, value in ps.evaluate().items():
+        assert result[key].units == value.units
+        assert np.isclose(result[key].m, value.m)
+
+
+def test_fold_units_interpreter_units():
+    params = {"a": {"amount": 3}, "b": {"formula": "a * 2 kg"}}
+    interpreter = PintInterpreter(units=["kg"])
+    ps = ParameterSet(params, interpreter=interpreter)
+    assert ps.unit_symbols == {"kg": PintWrapper.Unit("kg")}
+    assert ps.fold_units().evaluate()["b"] == PintWrapper.Quantity(6, "kg")
+
+
+def test_fold_units_user_symbols():
+    params = {"a": {"amount": 2, "unit": "m"}, "b": {"formula": "a * factor + 1 cm"}}
+    interpreter = PintInterpreter()
+    interpreter.add_symbols({"factor": 2.5})
+    folded = ParameterSet(params, interpreter=interpreter).fold_units()
+    assert "factor" in folded.parameter_set.interpreter.symtable
+    assert folded.evaluate()["b"] == PintWrapper.Quantity(5.01, "m")
+
+
+def test_fold_units_functions_and_globals():
+    params = {
+        "A": {"amount": 300, "unit": "mm"},
+        "B": {"formula": "exp(A / G) + 3"},
+        "C": {"formula": "sqrt(A * G) - 2 cm"},
+        "D": {"formula": "2 * 3"},
+    }
+    global_params = {"G": PintWrapper.Quantity(2, "m")}
+    expected = ParameterSet(params, global_params).evaluate()
+    result = ParameterSet(params, global_params).fold_units().evaluate()
+    assert result["D"] == 6
+    for key in "ABC":
+        assert np.isclose(result[key].to(expected[key].units).m, expected[key].m)
+
+
+def test_fold_units_errors():
+    params = {"A": {"amount": 1, "unit": "m"}, "B": {"formula": "A + 1 kg"}}
+    with pytest.raises(pint.DimensionalityError):
+        ParameterSet(params).fold_units()
+    params = {"A": {"amount": 1, "unit": "degC"}, "B": {"formula": "A * 2"}}
+    with pytest.raises(UnsupportedFormula):
+        ParameterSet(params).fold_units()
+    params = {
+        "m": {"amount": 3, "unit": "kg"},
+        "n": {"amount": 2},
+        "B": {"formula": "m ** n"},
+    }
+    assert ParameterSet(params).evaluate()["B"] == PintWrapper.Quantity(9, "kg ** 2")
+    with pytest.raises(UnsupportedFormula):
+        ParameterSet(params).fold_units()
+
+
+def test_fold_units_monte_carlo_and_scenarios():
+    params = {
+        "A": {
+            "amount": 1,
+            "unit": "m",
+            "uncertainty type": 4,
+            "minimum": 0.5,
+            "maximum": 1.5,
+        },
+        "B": {"formula": "A + 200 mm"},
+    }
+    ps = ParameterSet(params)
+    expected = ps.evaluate_monte_carlo(100, seed=7)
+    result = ps.fold_units().evaluate_monte_carlo(100, seed=7)
+    assert result["B"].units == PintWrapper.Unit("m")
+    assert np.allclose(result["B"].m, expected["B"].to("m").m)
+
+    result = ps.fold_units().evaluate_scenarios(
+        {"A": PintWrapper.Quantity(np.array([100, 200]), "cm")}
+    )
+    assert np.allclose(result["B"].to("m").m, [1.2, 2.2])
+    ps.update({"B": "A * 2"})
+    assert ps.fold_units().units["B"] == PintWrapper.Unit("m")
+
+
+def test_evaluate_exchanges():
+    ps = ParameterSet({"A": {"amount": 2, "unit": "m"}})
+    amounts = ps.evaluate_exchanges(["A * 3", "A + 50 cm", "A * 3"])
+    assert amounts[0] == PintWrapper.Quantity(6, "m")
+    assert amounts[1] == PintWrapper.Quantity(2.5, "m")
+    assert np.allclose(ps.evaluate_exchanges(["A * 3"], as_array=True), [6])
+    exchanges = [{"formula": "A * 2"}]
+    ps(exchanges)
+    assert exchanges[0]["amount"] == 4
+
+
+def test_monte_carlo_fold_constants():
+    params = {
+        "A": {
+            "amount": 1,
+            "unit": "m",
+            "uncertainty type": 4,
+            "minimum": 0.5,
+            "maximum": 1.5,
+        },
+        "B": {"amount": 20, "unit": "cm"},
+        "C": {"formula": "A + B"},
+        "D": {"formula": "B * 2"},
+    }
+    ps = ParameterSet(params)
+    assert ps.get_constants()["D"] == PintWrapper.Quantity(40, "cm")
+    expected = ps.evaluate_monte_carlo(50, seed=2)
+    result = ps.evaluate_monte_carlo(50, seed=2, fold_constants=True)
+    for key in params:
+        assert result[key].units == expected[key].units
+        assert np.allclose(result[key].m, expected[key].m)
+
+
+def test_compiled_globals_from_other_registry():
+    params = {"B": {"formula": "G + 50 cm"}}
+    global_params = {"G": ureg("2 m")}
+    result = ParameterSet(params, global_params).evaluate(compiled=True)
+    assert result["B"] == PintWrapper.Quantity(2.5, "m")
@@ -1,3 +1,7 @@
+import pytest
+from pint import UnitRegistry
+
+from bw2parameters.cache import LRUCache
 from bw2parameters.pint import PintWrapper, PintWrapperSingleton
 
 
@@ -31,3 +35,31 @@ def test_different_unit_registries():
     assert all(PintWrapper.is_quantity(q) for q in [q1, q2, q3])
     assert all(PintWrapper.is_quantity_from_same_registry(q) for q in [q1, q2])
     assert not PintWrapper.is_quantity_from_same_registry(q3)
+
+
+def test_unit_cache():
+    PintWrapper.unit_cache.clear()
+    assert PintWrapper.to_unit("kg") == PintWrapper.Unit("kg")
+    assert PintWrapper.to_unit("Deep_Thought") is None
+    assert PintWrapper.to_units(["kg", "Deep_Thought"]) == {
+        "kg": PintWrapper.Unit("kg")
+    }
+    info = PintWrapper.unit_cache_info()
+    assert (info.hits, info.misses, info.currsize) == (2, 2, 2)
+    with pytest.raises(PintWrapper.UndefinedUnitError):
+        PintWrapper.to_unit("Deep_Thought", raise_errors=True)
+
+
+def test_unit_cache_invalidated_by_definitions(monkeypatch):
+    # Define units in a separate registry, so they don't leak into other tests
+    ureg = UnitRegistry()
+    monkeypatch.setattr(PintWrapper, "ureg", ureg)
+    monkeypatch.setattr(PintWrapper, "Unit", ureg.Unit)
+    monkeypatch.setattr(PintWrapper, "unit_cache", LRUCache())
+    monkeypatch.setattr(PintWrapper, "_definitions", PintWrapper.count_definitions())
+    assert PintWrapper.to_unit("Agrajag") is None
+    PintWrapper.define("Agrajag = 42 * kg")
+    assert PintWrapper.to_unit("Agrajag") == ureg.Unit("Agrajag")
+    assert PintWrapper.to_unit("Gargravarr") is None
+    ureg.define("Gargravarr = 2 * m")
+    assert PintWrapper.to_unit("Gargravarr") == ureg.Unit("Gargravarr")
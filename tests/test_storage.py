@@ -0,0 +1,37 @@
+import numpy as np
+
+from bw2parameters import MonteCarloStore, ParameterSet
+
+params = {
+    "Deep_Thought": {
+        "amount": 5,
+        "uncertainty type": 4,
+        "minimum": 2,
+        "maximum": 8,
+    },
+    "Agrajag": {"amount": 3.14},
+    "East_River_Creature": {"formula": "Agrajag + Deep_Thought"},
+}
+
+
+def test_save_monte_carlo(tmp_path):
+    store = ParameterSet(params).save_monte_carlo(
+        tmp_path / "run", iterations=250, chunk_size=100, seed=42
+    )
+    expected = ParameterSet(params).evaluate_monte_carlo(250, seed=42, chunk_size=100)
+    assert isinstance(store, MonteCarloStore)
+    assert set(store) == set(params)
+    assert store.iterations == 250
+    for key in params:
+        assert np.array_equal(store[key], expected[key])
+
+
+def test_store_reopen_is_lazy_view(tmp_path):
+    ParameterSet(params).save_monte_carlo(tmp_path, iterations=50, chunk_size=20)
+    store = MonteCarloStore(tmp_path)
+    assert store._samples is None
+    array = store["East_River_Creature"]
+    assert isinstance(store.samples, np.memmap)
+    assert np.shares_memory(array, store.samples)
+    assert np.allclose(array, store["Deep_Thought"] + 3.14)
+    assert len(store) == 3